@@ -6,19 +6,28 @@ Includes user authentication
 """
 
 import os
+import json
+import atexit
 import hashlib
 import secrets
-import traceback
 import logging
+import threading
+import time
 from datetime import datetime, timedelta, date
-from functools import wraps
-from flask import Flask, jsonify, request, send_from_directory, session
+from contextlib import contextmanager
+from functools import wraps, lru_cache
+from itertools import repeat
+from flask import Flask, Response, g, jsonify, request, send_from_directory, session
 from flask_cors import CORS
+import numpy as np
+import orjson
 import psycopg
-from psycopg.rows import dict_row
-import clickhouse_connect
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import ConnectionPool, PoolTimeout
 from dotenv import load_dotenv
-from hijri_converter import Hijri, Gregorian
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env.production in parent directory
 env_path = os.path.join(os.path.dirname(__file__), '..', '.env.production')
@@ -49,9 +58,28 @@ CLICKHOUSE_CONFIG = {
     'password': os.getenv('CH_PASSWORD','biuser')
 }
 
+# PostgreSQL connection budget. Every gunicorn worker has its own pool, so the
+# server's max_connections (less a few slots kept for admin sessions) is split
+# evenly between the WEB_CONCURRENCY workers; PG_POOL_MAX_SIZE can only lower it.
+PG_MAX_CONNECTIONS = int(os.getenv('PG_MAX_CONNECTIONS', '100'))
+PG_RESERVED_CONNECTIONS = 10
+PG_POOL_MAX_SIZE = max(1, min(
+    int(os.getenv('PG_POOL_MAX_SIZE', '20')),
+    (PG_MAX_CONNECTIONS - PG_RESERVED_CONNECTIONS) // int(os.getenv('WEB_CONCURRENCY', '1'))
+))
+
 # Track database availability
 DB_AVAILABLE = False
 
+# Schema version written by init_database() - bump whenever init_database() changes
+SCHEMA_VERSION = 3
+
+# Password hashing - the salt is the BLAKE2b key (max 64 bytes). New hashes carry
+# a version prefix; unprefixed hashes are legacy SHA-256 and still verify.
+PASSWORD_SALT = os.getenv('PASSWORD_SALT', 'budget_app_salt_2024')
+_SALT_BYTES = PASSWORD_SALT.encode('utf-8')[:64]
+PASSWORD_HASH_PREFIX = 'b2$'
+
 # Predefined attributes from Final.xlsx
 METRICS = ['Census', 'Conversion', 'CPE', 'Avg Revenue/Night', 'ALOS', 'Direct Admissions #Episodes']
 CARE_TYPES = ['OP', 'ER', 'Non-LTC', 'LTC']
@@ -70,6 +98,9 @@ BRANCH_NAMES = {
     6: 'Abha'
 }
 
+# Display name for a user's branch; users without a branch see all branches
+BRANCH_DISPLAY = {None: 'All Branches', **BRANCH_NAMES}
+
 # Metric to Care Type mapping (which care types apply to which metrics)
 METRIC_CARE_TYPES = {
     'Census': ['OP', 'ER'],
@@ -90,6 +121,9 @@ METRIC_INPUT_TYPES = {
     'Direct Admissions #Episodes': 'Exact Value Number'
 }
 
+# Stay types whose census and episodes are distributed to days (others get 0)
+CENSUS_STAY_TYPES = frozenset(METRIC_CARE_TYPES['Census'])
+
 # Hardcoded Calendar Adjustment Factors
 CALENDAR_FACTORS = {
     'weekday': 1.0,      # Sunday - Thursday
@@ -102,22 +136,22 @@ CALENDAR_FACTORS = {
 }
 
 # KSA National Holidays (Gregorian dates - fixed)
-KSA_NATIONAL_HOLIDAYS_GREGORIAN = [
+KSA_NATIONAL_HOLIDAYS_GREGORIAN = frozenset({
     (9, 23),   # Saudi National Day (September 23)
     (2, 22),   # Founding Day (February 22)
-]
+})
 
 # KSA Holidays based on Hijri Calendar (Hijri month, day)
-KSA_HOLIDAYS_HIJRI = [
+KSA_HOLIDAYS_HIJRI = frozenset({
     (1, 1),    # Islamic New Year (1st Muharram)
-]
+})
 
 # Ramadan month in Hijri calendar
 RAMADAN_MONTH_HIJRI = 9
 
 # Eid Al-Fitr: 1st - 3rd of Shawwal (month 10)
 EID_FITR_MONTH_HIJRI = 10
-EID_FITR_DAYS = [1, 2, 3, 4]  # 4 days
+EID_FITR_DAYS = frozenset({1, 2, 3, 4})  # 4 days
 
 # Eid Al-Adha: 9th - 13th of Dhul Hijjah (month 12)
 EID_ADHA_MONTH_HIJRI = 12
@@ -125,182 +159,324 @@ EID_ADHA_START_DAY = 9   # Day of Arafah
 EID_ADHA_END_DAY = 13    # 5 days total
 
 
-def get_db_connection():
-    """Create a PostgreSQL database connection."""
-    conn = psycopg.connect(**DB_CONFIG, row_factory=dict_row, connect_timeout=10)
+def configure_db_connection(conn):
+    """Apply session settings once for each new pooled connection."""
     # Set statement timeout to 30 seconds to prevent indefinite hangs
     conn.execute("SET statement_timeout = '30s'")
-    return conn
+    conn.commit()
 
 
-def get_clickhouse_connection():
-    """Create a ClickHouse database connection."""
-    return clickhouse_connect.get_client(
-        host=CLICKHOUSE_CONFIG['host'],
-        port=CLICKHOUSE_CONFIG['port'],
-        database=CLICKHOUSE_CONFIG['database'],
-        username=CLICKHOUSE_CONFIG['username'],
-        password=CLICKHOUSE_CONFIG['password']
+# How long startup waits for the first PostgreSQL connection before giving up
+POOL_OPEN_TIMEOUT = 5
+
+
+def create_pool():
+    """Create the (unopened) PostgreSQL connection pool."""
+    return ConnectionPool(
+        conninfo=make_conninfo(**DB_CONFIG),
+        min_size=1,
+        max_size=PG_POOL_MAX_SIZE,
+        max_idle=300,
+        timeout=10,
+        kwargs={'row_factory': dict_row, 'connect_timeout': 10},
+        configure=configure_db_connection,
+        open=False
     )
 
 
+# PostgreSQL connection pool - connections are reused across requests instead of
+# paying the TCP/auth handshake on every call. Opened at startup (see below).
+POOL = create_pool()
+
+
+def get_db_connection():
+    """Borrow a PostgreSQL connection from the pool.
+    Use as a context manager: commits on success, rolls back on error and
+    returns the connection to the pool on exit."""
+    return POOL.connection()
+
+
+def get_request_db():
+    """Get the pooled connection for the current request.
+    Checked out on first use and reused for every query in the same request;
+    release_request_db() returns it to the pool when the request ends."""
+    if 'db' not in g:
+        g.db = POOL.getconn()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_request_db(exc):
+    """Commit (or roll back on error) and return the request's connection to the pool."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        try:
+            if exc is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            POOL.putconn(conn)
+
+
+@contextmanager
+def _db(commit=False, row_factory=None, name=''):
+    """Yield (conn, cur) on the request's pooled connection. Commits on success
+    when commit=True and always rolls back on error.
+    Repeated statements on a pooled connection are auto-prepared by psycopg.
+    A non-empty name gives a server-side cursor that fetches in batches."""
+    conn = get_request_db()
+    with conn.cursor(name, row_factory=row_factory) as cur:
+        try:
+            yield conn, cur
+            if commit:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+_clickhouse_client = None
+_clickhouse_lock = threading.Lock()
+
+
+def get_clickhouse_connection():
+    """Return the process-wide ClickHouse client, creating it on first use.
+    The client has no session id, so concurrent requests can share it; its
+    HTTP connections come from clickhouse_connect's pooled urllib3 manager.
+    """
+    global _clickhouse_client
+    if _clickhouse_client is None:
+        with _clickhouse_lock:
+            if _clickhouse_client is None:
+                # Imported lazily: clickhouse_connect is slow to import and only the
+                # income statement and daily budget routes need it
+                import clickhouse_connect
+                _clickhouse_client = clickhouse_connect.get_client(
+                    host=CLICKHOUSE_CONFIG['host'],
+                    port=CLICKHOUSE_CONFIG['port'],
+                    database=CLICKHOUSE_CONFIG['database'],
+                    username=CLICKHOUSE_CONFIG['username'],
+                    password=CLICKHOUSE_CONFIG['password'],
+                    autogenerate_session_id=False
+                )
+    return _clickhouse_client
+
+
+def query_frame(ch_client, query, parameters=None):
+    """Run a ClickHouse query and return the result as an object-dtype DataFrame.
+    Built from the driver's columnar blocks (no per-row tuples or dicts); values,
+    including NULLs as None, are exactly what query() returns.
+    """
+    import pandas as pd
+    result = ch_client.query(query, parameters=parameters)
+    return pd.DataFrame(dict(zip(result.column_names, result.result_columns)),
+                        columns=list(result.column_names), dtype=object)
+
+
+def schema_is_current(conn, cur):
+    """Check whether budget.schema_version already records SCHEMA_VERSION."""
+    try:
+        cur.execute("SELECT 1 FROM budget.schema_version WHERE v = %s", (SCHEMA_VERSION,))
+        return cur.fetchone() is not None
+    except psycopg.errors.UndefinedTable:
+        conn.rollback()
+        return False
+
+
+# Single-row revision counter behind assumptions_etag(); created and seeded by
+# init_database() and, if that never ran, on first use by ensure_assumptions_revision()
+ASSUMPTIONS_REVISION_SQL = """
+    CREATE TABLE IF NOT EXISTS budget.assumptions_revision (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        revision BIGINT NOT NULL DEFAULT 0
+    );
+    INSERT INTO budget.assumptions_revision (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+"""
+
+
 def init_database():
-    """Initialize the database schema with SCD versioning and scenario support."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create schema first
-    cur.execute("CREATE SCHEMA IF NOT EXISTS budget;")
-    
-    # Check if table exists and if scenario column exists
-    cur.execute("""
-        SELECT EXISTS (
-            SELECT 1 FROM information_schema.tables 
-            WHERE table_schema = 'budget' 
-            AND table_name = 'budget_assumptions'
-        );
-    """)
-    table_exists = cur.fetchone()['exists']
-    
-    if not table_exists:
-        # Create new table with scenario column
+    """Initialize the database schema with SCD versioning and scenario support.
+    Skipped entirely when the schema is already at SCHEMA_VERSION."""
+    with get_db_connection() as conn, conn.cursor() as cur:
+        # Hot restart: schema already initialized, skip all DDL round trips
+        if schema_is_current(conn, cur):
+            return
+        
+        # Only one worker initializes; the lock is held until this transaction commits
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('budget_init'))")
+        
+        # Create schema first
+        cur.execute("CREATE SCHEMA IF NOT EXISTS budget;")
         cur.execute("""
-            CREATE TABLE budget.budget_assumptions (
-                id SERIAL PRIMARY KEY,
-                metric VARCHAR(50) NOT NULL,
-                care_type VARCHAR(20) NOT NULL,
-                year INTEGER NOT NULL,
-                quarter INTEGER NOT NULL,
-                input_type VARCHAR(30) NOT NULL,
-                branch_id INTEGER NOT NULL,
-                scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely',
-                value DECIMAL(10, 4),
-                version INTEGER DEFAULT 1,
-                is_last_value BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                created_by VARCHAR(100) DEFAULT 'system',
-                UNIQUE(metric, care_type, year, quarter, branch_id, scenario, version)
+            CREATE TABLE IF NOT EXISTS budget.schema_version (
+                v INTEGER PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         """)
-    else:
-        # Table exists - check if scenario column exists
+        
+        # Another worker may have finished while we waited for the lock
+        if schema_is_current(conn, cur):
+            return
+
+        # Check if table exists and if scenario column exists
         cur.execute("""
             SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
+                SELECT 1 FROM information_schema.tables 
                 WHERE table_schema = 'budget' 
-                AND table_name = 'budget_assumptions' 
-                AND column_name = 'scenario'
+                AND table_name = 'budget_assumptions'
             );
         """)
-        scenario_exists = cur.fetchone()['exists']
-        
-        if not scenario_exists:
-            # Add scenario column to existing table
+        table_exists = cur.fetchone()['exists']
+    
+        if not table_exists:
+            # Create new table with scenario column
             cur.execute("""
-                ALTER TABLE budget.budget_assumptions 
-                ADD COLUMN scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely';
+                CREATE TABLE budget.budget_assumptions (
+                    id SERIAL PRIMARY KEY,
+                    metric VARCHAR(50) NOT NULL,
+                    care_type VARCHAR(20) NOT NULL,
+                    year INTEGER NOT NULL,
+                    quarter INTEGER NOT NULL,
+                    input_type VARCHAR(30) NOT NULL,
+                    branch_id INTEGER NOT NULL,
+                    scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely',
+                    value DECIMAL(10, 4),
+                    version INTEGER DEFAULT 1,
+                    is_last_value BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_by VARCHAR(100) DEFAULT 'system',
+                    UNIQUE(metric, care_type, year, quarter, branch_id, scenario, version)
+                );
+            """)
+        else:
+            # Table exists - add the scenario column if missing, drop ALL possible old
+            # constraint names (they don't include scenario) and ensure the new one
+            # exists. One anonymous block keeps this to a single round trip.
+            cur.execute("""
+                DO $$
+                BEGIN
+                    ALTER TABLE budget.budget_assumptions 
+                    ADD COLUMN IF NOT EXISTS scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely';
+                    
+                    ALTER TABLE budget.budget_assumptions 
+                    DROP CONSTRAINT IF EXISTS budget_assumptions_metric_care_type_year_quarter_branch_id_key,
+                    DROP CONSTRAINT IF EXISTS budget_assumptions_metric_care_type_year_quarter_branch__key,
+                    DROP CONSTRAINT IF EXISTS budget_assumptions_metric_care_type_year_quarter_branch_id__key;
+                    
+                    IF NOT EXISTS (
+                        SELECT 1 FROM pg_constraint 
+                        WHERE conrelid = 'budget.budget_assumptions'::regclass 
+                        AND conname = 'budget_assumptions_unique_scenario'
+                    ) THEN
+                        ALTER TABLE budget.budget_assumptions 
+                        ADD CONSTRAINT budget_assumptions_unique_scenario 
+                        UNIQUE(metric, care_type, year, quarter, branch_id, scenario, version);
+                    END IF;
+                END $$;
             """)
         
-        # Always ensure old constraints are dropped and new one exists
-        # Drop ALL possible old constraint names (they don't include scenario)
-        cur.execute("""
-            ALTER TABLE budget.budget_assumptions 
-            DROP CONSTRAINT IF EXISTS budget_assumptions_metric_care_type_year_quarter_branch_id_key;
-        """)
-        cur.execute("""
-            ALTER TABLE budget.budget_assumptions 
-            DROP CONSTRAINT IF EXISTS budget_assumptions_metric_care_type_year_quarter_branch__key;
-        """)
+        # Create indexes
         cur.execute("""
-            ALTER TABLE budget.budget_assumptions 
-            DROP CONSTRAINT IF EXISTS budget_assumptions_metric_care_type_year_quarter_branch_id__key;
-        """)
+            CREATE INDEX IF NOT EXISTS idx_budget_last_value 
+            ON budget.budget_assumptions(year, is_last_value);
         
-        # Check if the correct constraint exists
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.table_constraints 
-                WHERE table_schema = 'budget' 
-                AND table_name = 'budget_assumptions' 
-                AND constraint_name = 'budget_assumptions_unique_scenario'
-            );
-        """)
-        new_constraint_exists = cur.fetchone()['exists']
+            CREATE INDEX IF NOT EXISTS idx_budget_scenario 
+            ON budget.budget_assumptions(year, scenario);
         
-        if not new_constraint_exists:
-            cur.execute("""
-                ALTER TABLE budget.budget_assumptions 
-                ADD CONSTRAINT budget_assumptions_unique_scenario 
-                UNIQUE(metric, care_type, year, quarter, branch_id, scenario, version);
-            """)
-    
-    # Create indexes
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_budget_last_value 
-        ON budget.budget_assumptions(year, is_last_value);
+            CREATE INDEX IF NOT EXISTS idx_budget_composite 
+            ON budget.budget_assumptions(metric, care_type, year, quarter, branch_id, is_last_value);
         
-        CREATE INDEX IF NOT EXISTS idx_budget_scenario 
-        ON budget.budget_assumptions(year, scenario);
+            -- Current values for a year/scenario, already in the order the API returns them
+            CREATE INDEX IF NOT EXISTS idx_budget_current_ordered
+            ON budget.budget_assumptions(year, scenario, metric, care_type, quarter, branch_id)
+            INCLUDE (id, input_type, value, version, created_at, updated_at)
+            WHERE is_last_value = TRUE;
         
-        CREATE INDEX IF NOT EXISTS idx_budget_composite 
-        ON budget.budget_assumptions(metric, care_type, year, quarter, branch_id, is_last_value);
-    """)
-    
-    # Create users table with branch support
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            password_hash VARCHAR(128) NOT NULL,
-            full_name VARCHAR(100),
-            email VARCHAR(100),
-            role VARCHAR(20) DEFAULT 'user',
-            branch_id INTEGER,
-            is_active BOOLEAN DEFAULT TRUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        );
-    """)
-    
-    # Check if branch_id column exists, add if not
-    cur.execute("""
-        SELECT EXISTS (
-            SELECT 1 FROM information_schema.columns 
-            WHERE table_schema = 'budget' 
-            AND table_name = 'users' 
-            AND column_name = 'branch_id'
-        );
-    """)
-    branch_col_exists = cur.fetchone()['exists']
+            -- Full version history for a year/scenario in history order
+            CREATE INDEX IF NOT EXISTS idx_budget_history_ordered
+            ON budget.budget_assumptions(year, scenario, metric, care_type, quarter, branch_id, version DESC);
+        """)
     
-    if not branch_col_exists:
+        # Create users table with branch support
         cur.execute("""
-            ALTER TABLE budget.users ADD COLUMN branch_id INTEGER;
+            CREATE TABLE IF NOT EXISTS budget.users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                password_hash VARCHAR(128) NOT NULL,
+                full_name VARCHAR(100),
+                email VARCHAR(100),
+                role VARCHAR(20) DEFAULT 'user',
+                branch_id INTEGER,
+                is_active BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_login TIMESTAMP
+            );
         """)
     
-    # Create default admin user if no users exist
-    cur.execute("SELECT COUNT(*) as count FROM budget.users;")
-    user_count = cur.fetchone()['count']
-    
-    if user_count == 0:
-        # Create default admin user (password: admin123)
-        admin_password_hash = hash_password('admin123')
+        # Add branch_id column if missing
+        cur.execute("""
+            ALTER TABLE budget.users ADD COLUMN IF NOT EXISTS branch_id INTEGER;
+        """)
+        
+        # Single-row counter bumped by the assumption writers; the lookup ETags use it
+        cur.execute(ASSUMPTIONS_REVISION_SQL)
+
+        # Create default admin user (password: admin123) if no users exist
         cur.execute("""
             INSERT INTO budget.users (username, password_hash, full_name, role)
-            VALUES ('admin', %s, 'Administrator', 'admin');
-        """, (admin_password_hash,))
-        print("Default admin user created (username: admin, password: admin123)")
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+            SELECT 'admin', %s, 'Administrator', 'admin'
+            WHERE NOT EXISTS (SELECT 1 FROM budget.users)
+            ON CONFLICT (username) DO NOTHING
+            RETURNING id;
+        """, (hash_password('admin123'),))
+        if cur.fetchone():
+            logger.info("Default admin user created (username: admin, password: admin123)")
+        
+        cur.execute("INSERT INTO budget.schema_version (v) VALUES (%s) ON CONFLICT DO NOTHING", (SCHEMA_VERSION,))
 
 
 def hash_password(password):
-    """Hash a password using SHA-256 with salt."""
-    salt = os.getenv('PASSWORD_SALT', 'budget_app_salt_2024')
-    return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
+    """Hash a password using BLAKE2b keyed with the salt (version-prefixed)."""
+    digest = hashlib.blake2b(password.encode('utf-8'), key=_SALT_BYTES, digest_size=32).hexdigest()
+    return PASSWORD_HASH_PREFIX + digest
+
+
+def legacy_hash_password(password):
+    """Hash a password using the legacy SHA-256 with salt scheme."""
+    return hashlib.sha256(f"{password}{PASSWORD_SALT}".encode()).hexdigest()
+
+
+def password_hash_candidates(password):
+    """Return the current and legacy hashes of a password.
+    Stored hashes without a version prefix are legacy SHA-256 hashes; matching
+    against both lets existing accounts log in while they are migrated."""
+    return [hash_password(password), legacy_hash_password(password)]
+
+
+def json_body():
+    """Return the request's JSON object, or {} if the body is missing or not an object.
+    Parsed with orjson: the daily budget publish body can carry 10^5 detail rows."""
+    if not request.is_json:
+        return {}
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+# Naive timestamps are emitted as UTC, matching what jsonify sent before
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+# Naive timestamps as plain ISO strings, matching datetime.isoformat()
+ORJSON_ISO_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def ojsonify(obj, status=200, option=ORJSON_OPTIONS):
+    """jsonify() replacement backed by orjson for large or hot responses."""
+    return Response(orjson.dumps(obj, default=str, option=option),
+                    status=status, mimetype='application/json')
 
 
 def login_required(f):
@@ -333,59 +509,34 @@ def is_ksa_national_holiday(check_date):
     return month_day in KSA_NATIONAL_HOLIDAYS_GREGORIAN
 
 
-def is_hijri_holiday(check_date):
-    """Check if a date corresponds to a Hijri-based holiday."""
+def _hijri_month_day(check_date):
+    """Return (hijri_month, hijri_day) for a Gregorian date, or (None, None) if out of range."""
+    from hijri_converter import Gregorian
     try:
-        # Convert Gregorian to Hijri
         hijri_date = Gregorian(check_date.year, check_date.month, check_date.day).to_hijri()
-        month_day = (hijri_date.month, hijri_date.day)
-        return month_day in KSA_HOLIDAYS_HIJRI
-    except Exception as e:
-        print(f"Error converting date to Hijri: {e}")
-        return False
+    except Exception:
+        logger.warning("Hijri conversion failed for %s", check_date)
+        return None, None
+    return hijri_date.month, hijri_date.day
 
 
-def is_ramadan(check_date):
-    """Check if a date falls in Ramadan."""
-    try:
-        hijri_date = Gregorian(check_date.year, check_date.month, check_date.day).to_hijri()
-        return hijri_date.month == RAMADAN_MONTH_HIJRI
-    except Exception as e:
-        print(f"Error checking Ramadan: {e}")
-        return False
-
-
-def is_eid_fitr(check_date):
-    """Check if a date falls in Eid Al-Fitr period."""
-    try:
-        hijri_date = Gregorian(check_date.year, check_date.month, check_date.day).to_hijri()
-        return (hijri_date.month == EID_FITR_MONTH_HIJRI and 
-                hijri_date.day in EID_FITR_DAYS)
-    except Exception as e:
-        print(f"Error checking Eid Fitr: {e}")
-        return False
-
-
-def is_eid_adha(check_date):
-    """Check if a date falls in Eid Al-Adha period."""
-    try:
-        hijri_date = Gregorian(check_date.year, check_date.month, check_date.day).to_hijri()
-        return (hijri_date.month == EID_ADHA_MONTH_HIJRI and 
-                EID_ADHA_START_DAY <= hijri_date.day <= EID_ADHA_END_DAY)
-    except Exception as e:
-        print(f"Error checking Eid Adha: {e}")
-        return False
-
-
-def get_calendar_adjustment_factor(check_date):
-    """Get the calendar adjustment factor for a specific date.
+@lru_cache(maxsize=8192)
+def _factor_for_ordinal(ordinal):
+    """Calendar adjustment factor for a date given as its proleptic ordinal.
+    Cached so each unique day pays the Gregorian -> Hijri conversion only once.
     Priority: Eid > National Holiday > Hijri Holiday > Ramadan > Day of Week
     """
+    check_date = date.fromordinal(ordinal)
+    
+    # Convert Gregorian to Hijri once and reuse it for every Hijri-based check
+    # (a failed conversion is logged once per date thanks to the cache)
+    hijri_month, hijri_day = _hijri_month_day(check_date)
+    
     # Check Eid periods (highest priority)
-    if is_eid_adha(check_date):
+    if hijri_month == EID_ADHA_MONTH_HIJRI and EID_ADHA_START_DAY <= hijri_day <= EID_ADHA_END_DAY:
         return CALENDAR_FACTORS['eid_adha']
     
-    if is_eid_fitr(check_date):
+    if hijri_month == EID_FITR_MONTH_HIJRI and hijri_day in EID_FITR_DAYS:
         return CALENDAR_FACTORS['eid_fitr']
     
     # Check national holidays
@@ -393,11 +544,11 @@ def get_calendar_adjustment_factor(check_date):
         return CALENDAR_FACTORS['holiday']
     
     # Check Hijri-based holidays
-    if is_hijri_holiday(check_date):
+    if (hijri_month, hijri_day) in KSA_HOLIDAYS_HIJRI:
         return CALENDAR_FACTORS['holiday']
     
     # Check Ramadan
-    if is_ramadan(check_date):
+    if hijri_month == RAMADAN_MONTH_HIJRI:
         return CALENDAR_FACTORS['ramadan']
     
     # Day of week factors (0=Monday, 4=Friday, 5=Saturday, 6=Sunday)
@@ -410,19 +561,77 @@ def get_calendar_adjustment_factor(check_date):
         return CALENDAR_FACTORS['weekday']
 
 
-# Initialize database on startup
+def get_calendar_adjustment_factor(check_date):
+    """Get the calendar adjustment factor for a specific date.
+    Priority: Eid > National Holiday > Hijri Holiday > Ramadan > Day of Week
+    """
+    return _factor_for_ordinal(check_date.toordinal())
+
+
+@lru_cache(maxsize=16)
+def calendar_factor_array(year):
+    """Calendar adjustment factors for a whole year as a read-only array.
+    Index is the zero-based day of year (Jan 1 = 0); slot 365 is 0.0 for
+    non-leap years so every year has shape (366,).
+    """
+    start = date(year, 1, 1).toordinal()
+    days_in_year = date(year + 1, 1, 1).toordinal() - start
+    factors = np.zeros(366, dtype=np.float64)
+    for i in range(days_in_year):
+        factors[i] = _factor_for_ordinal(start + i)
+    factors.flags.writeable = False
+    return factors
+
+
+def get_calendar_adjustment_factor_vec(year, doy_array):
+    """Vectorized lookup of calendar factors for zero-based days of year."""
+    return calendar_factor_array(year)[doy_array]
+
+
+# Open the connection pool on startup and close it when the process exits.
+# Waiting for the first connection here means an unreachable database fails the
+# boot once, after POOL_OPEN_TIMEOUT, and the init steps below are skipped
+# instead of each waiting out the pool timeout.
 try:
-    init_database()
+    POOL.open(wait=True, timeout=POOL_OPEN_TIMEOUT)
     DB_AVAILABLE = True
-    print("Database initialized successfully")
-except Exception as e:
-    DB_AVAILABLE = False
-    print(f"Database initialization warning: {e}")
+except PoolTimeout as e:
+    logger.warning("Database connection warning: %s", e)
+    # A timed-out wait closes the pool; start a fresh one without waiting so
+    # requests can connect once the database is reachable again
+    POOL = create_pool()
+    POOL.open()
+atexit.register(lambda: POOL.close())
+
+# Initialize database on startup
+if DB_AVAILABLE:
+    try:
+        init_database()
+        logger.info("Database initialized successfully")
+    except Exception:
+        DB_AVAILABLE = False
+        logger.warning("Database initialization failed", exc_info=True)
+
+
+# index.html is the SPA entry point and is hit on every page load; keep its
+# bytes in memory for the life of the process
+try:
+    with open(os.path.join(app.static_folder, 'index.html'), 'rb') as f:
+        _INDEX_HTML = f.read()
+    _INDEX_ETAG = hashlib.blake2b(_INDEX_HTML, digest_size=8).hexdigest()
+except OSError:
+    _INDEX_HTML = None
+    _INDEX_ETAG = None
 
 
 @app.route('/')
 def serve_frontend():
-    return send_from_directory(app.static_folder, 'index.html')
+    if _INDEX_HTML is None:
+        return send_from_directory(app.static_folder, 'index.html')
+    cached = not_modified(_INDEX_ETAG, 'no-cache')
+    if cached:
+        return cached
+    return with_cache_headers(Response(_INDEX_HTML, mimetype='text/html'), _INDEX_ETAG, 'no-cache')
 
 
 @app.route('/<path:path>')
@@ -436,43 +645,35 @@ def serve_static(path):
 def login():
     """User login endpoint."""
     try:
-        data = request.json
+        data = json_body()
         username = data.get('username', '').strip()
         password = data.get('password', '')
         
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        password_hash = hash_password(password)
-        cur.execute("""
-            SELECT id, username, full_name, email, role, branch_id, is_active
-            FROM budget.users 
-            WHERE username = %s AND password_hash = %s
-        """, (username, password_hash))
-        
-        user = cur.fetchone()
-        
-        if not user:
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Invalid username or password'}), 401
+        with _db(commit=True) as (conn, cur):
+            # Authenticate and record last login in one statement
+            # (also migrates a legacy password hash to the current scheme)
+            password_hashes = password_hash_candidates(password)
+            cur.execute("""
+                UPDATE budget.users SET last_login = CURRENT_TIMESTAMP, password_hash = %s
+                WHERE username = %s AND password_hash = ANY(%s) AND is_active
+                RETURNING id, username, full_name, email, role, branch_id
+            """, (password_hashes[0], username, password_hashes))
         
-        if not user['is_active']:
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Account is disabled'}), 403
-        
-        # Update last login
-        cur.execute("""
-            UPDATE budget.users SET last_login = CURRENT_TIMESTAMP WHERE id = %s
-        """, (user['id'],))
-        conn.commit()
-        cur.close()
-        conn.close()
+            user = cur.fetchone()
         
+            if not user:
+                # Distinguish a disabled account from bad credentials (failure path only)
+                cur.execute("""
+                    SELECT 1 FROM budget.users 
+                    WHERE username = %s AND password_hash = ANY(%s) AND NOT is_active
+                """, (username, password_hashes))
+                if cur.fetchone():
+                    return jsonify({'error': 'Account is disabled'}), 403
+                return jsonify({'error': 'Invalid username or password'}), 401
+
         # Set session
         session.permanent = True
         session['user_id'] = user['id']
@@ -490,7 +691,7 @@ def login():
                 'email': user['email'],
                 'role': user['role'],
                 'branch_id': user['branch_id'],
-                'branch_name': BRANCH_NAMES.get(user['branch_id'], 'All Branches') if user['branch_id'] else 'All Branches'
+                'branch_name': BRANCH_DISPLAY.get(user['branch_id'], 'All Branches')
             }
         })
     except Exception as e:
@@ -508,19 +709,21 @@ def logout():
 def check_auth():
     """Check if user is authenticated."""
     if 'user_id' in session:
-        branch_id = session.get('branch_id')
-        return jsonify({
+        # Snapshot the session once; lookups below are plain dict reads
+        s = dict(session)
+        branch_id = s.get('branch_id')
+        return ojsonify({
             'authenticated': True,
             'user': {
-                'id': session.get('user_id'),
-                'username': session.get('username'),
-                'full_name': session.get('full_name'),
-                'role': session.get('role'),
+                'id': s.get('user_id'),
+                'username': s.get('username'),
+                'full_name': s.get('full_name'),
+                'role': s.get('role'),
                 'branch_id': branch_id,
-                'branch_name': BRANCH_NAMES.get(branch_id, 'All Branches') if branch_id else 'All Branches'
+                'branch_name': BRANCH_DISPLAY.get(branch_id, 'All Branches')
             }
         })
-    return jsonify({'authenticated': False})
+    return ojsonify({'authenticated': False})
 
 
 @app.route('/api/auth/change-password', methods=['POST'])
@@ -528,7 +731,7 @@ def check_auth():
 def change_password():
     """Change user password."""
     try:
-        data = request.json
+        data = json_body()
         current_password = data.get('current_password', '')
         new_password = data.get('new_password', '')
         
@@ -538,30 +741,21 @@ def change_password():
         if len(new_password) < 6:
             return jsonify({'error': 'New password must be at least 6 characters'}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Verify current password
-        current_hash = hash_password(current_password)
-        cur.execute("""
-            SELECT id FROM budget.users 
-            WHERE id = %s AND password_hash = %s
-        """, (session['user_id'], current_hash))
-        
-        if not cur.fetchone():
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Current password is incorrect'}), 401
+        with _db(commit=True) as (conn, cur):
+            # Verify current password
+            cur.execute("""
+                SELECT id FROM budget.users 
+                WHERE id = %s AND password_hash = ANY(%s)
+            """, (session['user_id'], password_hash_candidates(current_password)))
         
-        # Update password
-        new_hash = hash_password(new_password)
-        cur.execute("""
-            UPDATE budget.users SET password_hash = %s WHERE id = %s
-        """, (new_hash, session['user_id']))
+            if not cur.fetchone():
+                return jsonify({'error': 'Current password is incorrect'}), 401
         
-        conn.commit()
-        cur.close()
-        conn.close()
+            # Update password
+            new_hash = hash_password(new_password)
+            cur.execute("""
+                UPDATE budget.users SET password_hash = %s WHERE id = %s
+            """, (new_hash, session['user_id']))
         
         return jsonify({'success': True, 'message': 'Password changed successfully'})
     except Exception as e:
@@ -575,24 +769,21 @@ def change_password():
 def get_users():
     """Get all users (admin only)."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, username, full_name, email, role, branch_id, is_active, created_at, last_login
-            FROM budget.users ORDER BY created_at DESC
-        """)
-        users = cur.fetchall()
-        cur.close()
-        conn.close()
+        with _db() as (conn, cur):
+            cur.execute("""
+                SELECT id, username, full_name, email, role, branch_id, is_active, created_at, last_login
+                FROM budget.users ORDER BY created_at DESC
+            """)
+            users = cur.fetchall()
         
         # Add branch names to users
         users_list = []
         for u in users:
             user_dict = dict(u)
-            user_dict['branch_name'] = BRANCH_NAMES.get(u['branch_id'], 'All Branches') if u['branch_id'] else 'All Branches'
+            user_dict['branch_name'] = BRANCH_DISPLAY.get(u['branch_id'], 'All Branches')
             users_list.append(user_dict)
         
-        return jsonify({'users': users_list, 'branches': BRANCH_NAMES})
+        return ojsonify({'users': users_list, 'branches': BRANCH_NAMES})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -602,7 +793,7 @@ def get_users():
 def create_user():
     """Create a new user (admin only)."""
     try:
-        data = request.json
+        data = json_body()
         username = data.get('username', '').strip()
         password = data.get('password', '')
         full_name = data.get('full_name', '').strip()
@@ -613,6 +804,9 @@ def create_user():
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
         
+        if len(username) > 50:
+            return jsonify({'error': 'Username must be at most 50 characters'}), 400
+        
         if len(password) < 6:
             return jsonify({'error': 'Password must be at least 6 characters'}), 400
         
@@ -628,87 +822,79 @@ def create_user():
             except (ValueError, TypeError):
                 branch_id = None
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        with _db(commit=True) as (conn, cur):
+            # Check if username exists
+            cur.execute("SELECT id FROM budget.users WHERE username = %s", (username,))
+            if cur.fetchone():
+                return jsonify({'error': 'Username already exists'}), 400
         
-        # Check if username exists
-        cur.execute("SELECT id FROM budget.users WHERE username = %s", (username,))
-        if cur.fetchone():
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Username already exists'}), 400
-        
-        password_hash = hash_password(password)
-        cur.execute("""
-            INSERT INTO budget.users (username, password_hash, full_name, email, role, branch_id)
-            VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
-        """, (username, password_hash, full_name, email, role, branch_id))
+            password_hash = hash_password(password)
+            cur.execute("""
+                INSERT INTO budget.users (username, password_hash, full_name, email, role, branch_id)
+                VALUES (%s, %s, %s, %s, %s, %s) RETURNING id
+            """, (username, password_hash, full_name, email, role, branch_id))
         
-        new_id = cur.fetchone()['id']
-        conn.commit()
-        cur.close()
-        conn.close()
+            new_id = cur.fetchone()['id']
         
         return jsonify({'success': True, 'user_id': new_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+UPDATE_USER_SQL = """
+    UPDATE budget.users SET
+        full_name = CASE WHEN %(full_name_set)s THEN %(full_name)s ELSE full_name END,
+        email = CASE WHEN %(email_set)s THEN %(email)s ELSE email END,
+        role = COALESCE(%(role)s, role),
+        is_active = COALESCE(%(is_active)s, is_active),
+        branch_id = CASE WHEN %(branch_set)s THEN %(branch_id)s ELSE branch_id END,
+        password_hash = COALESCE(%(password_hash)s, password_hash)
+    WHERE id = %(id)s
+"""
+
+
 @app.route('/api/users/<int:user_id>', methods=['PUT'])
 @admin_required
 def update_user(user_id):
     """Update a user (admin only)."""
     try:
-        data = request.json
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        updates = []
-        params = []
-        
-        if 'full_name' in data:
-            updates.append("full_name = %s")
-            params.append(data['full_name'])
-        if 'email' in data:
-            updates.append("email = %s")
-            params.append(data['email'])
-        if 'role' in data and data['role'] in ['user', 'admin']:
-            updates.append("role = %s")
-            params.append(data['role'])
-        if 'is_active' in data:
-            updates.append("is_active = %s")
-            params.append(data['is_active'])
-        if 'branch_id' in data:
+        data = json_body()
+        
+        params = {
+            'id': user_id,
+            'full_name_set': 'full_name' in data,
+            'full_name': data.get('full_name'),
+            'email_set': 'email' in data,
+            'email': data.get('email'),
+            'role': data['role'] if data.get('role') in ['user', 'admin'] else None,
+            'is_active': data.get('is_active'),
+            'branch_set': 'branch_id' in data,
+            'branch_id': None,
+            'password_hash': None,
+        }
+        if params['branch_set']:
             branch_id = data['branch_id']
             if branch_id is not None and branch_id != '':
                 try:
                     branch_id = int(branch_id)
-                    if branch_id not in BRANCHES:
-                        branch_id = None
+                    if branch_id in BRANCHES:
+                        params['branch_id'] = branch_id
                 except (ValueError, TypeError):
-                    branch_id = None
-            else:
-                branch_id = None
-            updates.append("branch_id = %s")
-            params.append(branch_id)
+                    pass
         if 'password' in data and data['password']:
             if len(data['password']) < 6:
                 return jsonify({'error': 'Password must be at least 6 characters'}), 400
-            updates.append("password_hash = %s")
-            params.append(hash_password(data['password']))
+            params['password_hash'] = hash_password(data['password'])
         
-        if not updates:
+        if not (params['full_name_set'] or params['email_set'] or params['branch_set']
+                or params['role'] is not None or params['is_active'] is not None
+                or params['password_hash'] is not None):
             return jsonify({'error': 'No fields to update'}), 400
         
-        params.append(user_id)
-        cur.execute(f"""
-            UPDATE budget.users SET {', '.join(updates)} WHERE id = %s
-        """, params)
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        with _db(commit=True) as (conn, cur):
+            # Fixed statement text so the server can reuse a prepared plan;
+            # None / unset flags leave the column unchanged
+            cur.execute(UPDATE_USER_SQL, params)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -724,12 +910,8 @@ def delete_user(user_id):
         if user_id == session.get('user_id'):
             return jsonify({'error': 'Cannot delete your own account'}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM budget.users WHERE id = %s", (user_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with _db(commit=True) as (conn, cur):
+            cur.execute("DELETE FROM budget.users WHERE id = %s", (user_id,))
         
         return jsonify({'success': True})
     except Exception as e:
@@ -739,41 +921,101 @@ def delete_user(user_id):
 # ============== Budget Data Routes ==============
 
 
+# The config payload only changes on deploy, so serialize it once at import
+_CONFIG_JSON = json.dumps({
+    'metrics': METRICS,
+    'care_types': CARE_TYPES,
+    'input_types': INPUT_TYPES,
+    'branches': BRANCHES,
+    'quarters': QUARTERS,
+    'branch_names': BRANCH_NAMES,
+    'metric_care_types': METRIC_CARE_TYPES,
+    'metric_input_types': METRIC_INPUT_TYPES,
+    'scenarios': SCENARIOS
+}, sort_keys=True, separators=(',', ':'))
+_CONFIG_ETAG = hashlib.blake2b(_CONFIG_JSON.encode('utf-8'), digest_size=8).hexdigest()
+CONFIG_CACHE_CONTROL = 'public, max-age=3600'
+
+# Lookup lists change whenever budget data is saved, so clients must revalidate
+LOOKUP_CACHE_CONTROL = 'private, no-cache'
+
+
+def not_modified(etag, cache_control):
+    """Return a 304 response if the client already holds the current representation."""
+    if etag not in request.if_none_match:
+        return None
+    return with_cache_headers(Response(status=304), etag, cache_control)
+
+
+def with_cache_headers(response, etag, cache_control):
+    """Attach ETag and Cache-Control headers to a response."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+_assumptions_revision_ready = False
+
+
+def ensure_assumptions_revision():
+    """Create and seed budget.assumptions_revision once per process.
+    Runs on its own pooled connection and commits straight away, so the counter
+    exists even when init_database() was skipped at boot and does not depend on
+    the caller's transaction."""
+    global _assumptions_revision_ready
+    if not _assumptions_revision_ready:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            # Same lock as init_database(): concurrent CREATE IF NOT EXISTS can still collide
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('budget_init'))")
+            cur.execute(ASSUMPTIONS_REVISION_SQL)
+        _assumptions_revision_ready = True
+
+
+def assumptions_etag(cur):
+    """ETag for lookups derived from budget_assumptions. Reads the single-row
+    revision counter, which the writers that can add a year, branch or scenario
+    advance with bump_assumptions_revision()."""
+    ensure_assumptions_revision()
+    cur.execute("SELECT revision FROM budget.assumptions_revision")
+    return f"a{cur.fetchone()[0]}"
+
+
+def bump_assumptions_revision(cur):
+    """Advance the revision behind assumptions_etag(); call in the writing transaction."""
+    ensure_assumptions_revision()
+    cur.execute("UPDATE budget.assumptions_revision SET revision = revision + 1")
+
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """Return predefined configuration options."""
-    return jsonify({
-        'metrics': METRICS,
-        'care_types': CARE_TYPES,
-        'input_types': INPUT_TYPES,
-        'branches': BRANCHES,
-        'quarters': QUARTERS,
-        'branch_names': BRANCH_NAMES,
-        'metric_care_types': METRIC_CARE_TYPES,
-        'metric_input_types': METRIC_INPUT_TYPES,
-        'scenarios': SCENARIOS
-    })
+    cached = not_modified(_CONFIG_ETAG, CONFIG_CACHE_CONTROL)
+    if cached:
+        return cached
+    return with_cache_headers(Response(_CONFIG_JSON, mimetype='application/json'),
+                              _CONFIG_ETAG, CONFIG_CACHE_CONTROL)
 
 
 @app.route('/api/years', methods=['GET'])
 def get_years():
     """Get list of years that have data."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT year 
-            FROM budget.budget_assumptions 
-            WHERE is_last_value = TRUE 
-            ORDER BY year DESC
-        """)
-        years = [row['year'] for row in cur.fetchall()]
-        cur.close()
-        conn.close()
-        return jsonify({'years': years})
-    except Exception as e:
+        with _db(row_factory=tuple_row) as (conn, cur):
+            etag = assumptions_etag(cur)
+            cached = not_modified(etag, LOOKUP_CACHE_CONTROL)
+            if cached:
+                return cached
+            cur.execute("""
+                SELECT DISTINCT year 
+                FROM budget.budget_assumptions 
+                WHERE is_last_value = TRUE 
+                ORDER BY year DESC
+            """)
+            years = [row[0] for row in cur.fetchall()]
+        return with_cache_headers(jsonify({'years': years}), etag, LOOKUP_CACHE_CONTROL)
+    except Exception:
         # Return empty list if DB not available - allows new year creation
-        print(f"Warning: Could not fetch years - {e}")
+        logger.warning("Could not fetch years", exc_info=True)
         return jsonify({'years': []})
 
 
@@ -781,26 +1023,27 @@ def get_years():
 def get_branches():
     """Get list of branches that have budget assumptions data."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT branch_id 
-            FROM budget.budget_assumptions 
-            WHERE is_last_value = TRUE 
-            ORDER BY branch_id
-        """)
-        branch_ids = [row['branch_id'] for row in cur.fetchall()]
-        cur.close()
-        conn.close()
+        with _db(row_factory=tuple_row) as (conn, cur):
+            etag = assumptions_etag(cur)
+            cached = not_modified(etag, LOOKUP_CACHE_CONTROL)
+            if cached:
+                return cached
+            cur.execute("""
+                SELECT DISTINCT branch_id 
+                FROM budget.budget_assumptions 
+                WHERE is_last_value = TRUE 
+                ORDER BY branch_id
+            """)
+            branch_ids = [row[0] for row in cur.fetchall()]
         
         # Return branches with their names
         branches = [
             {'id': bid, 'name': BRANCH_NAMES.get(bid, f'Branch {bid}')}
             for bid in branch_ids
         ]
-        return jsonify({'branches': branches})
-    except Exception as e:
-        print(f"Warning: Could not fetch branches - {e}")
+        return with_cache_headers(jsonify({'branches': branches}), etag, LOOKUP_CACHE_CONTROL)
+    except Exception:
+        logger.warning("Could not fetch branches", exc_info=True)
         return jsonify({'branches': []})
 
 
@@ -808,17 +1051,18 @@ def get_branches():
 def get_scenarios():
     """Get list of scenarios that have budget assumptions data."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT scenario 
-            FROM budget.budget_assumptions 
-            WHERE is_last_value = TRUE 
-            ORDER BY scenario
-        """)
-        scenario_names = [row['scenario'] for row in cur.fetchall()]
-        cur.close()
-        conn.close()
+        with _db(row_factory=tuple_row) as (conn, cur):
+            etag = assumptions_etag(cur)
+            cached = not_modified(etag, LOOKUP_CACHE_CONTROL)
+            if cached:
+                return cached
+            cur.execute("""
+                SELECT DISTINCT scenario 
+                FROM budget.budget_assumptions 
+                WHERE is_last_value = TRUE 
+                ORDER BY scenario
+            """)
+            scenario_names = [row[0] for row in cur.fetchall()]
         
         # Return scenarios with display names
         scenario_display = {
@@ -830,9 +1074,9 @@ def get_scenarios():
             {'value': scenario, 'label': scenario_display.get(scenario, scenario.replace('_', ' ').title())}
             for scenario in scenario_names
         ]
-        return jsonify({'scenarios': scenarios})
-    except Exception as e:
-        print(f"Warning: Could not fetch scenarios - {e}")
+        return with_cache_headers(jsonify({'scenarios': scenarios}), etag, LOOKUP_CACHE_CONTROL)
+    except Exception:
+        logger.warning("Could not fetch scenarios", exc_info=True)
         return jsonify({'scenarios': []})
 
 
@@ -852,58 +1096,38 @@ def get_budget_data(year):
         user_branch = session.get('branch_id')
         user_role = session.get('role')
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Filter by branch if user has one assigned (and is not admin)
-        if user_branch and user_role != 'admin':
-            cur.execute("""
-                SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
-                       scenario, value, version, created_at, updated_at
-                FROM budget.budget_assumptions 
-                WHERE year = %s AND scenario = %s AND is_last_value = TRUE AND branch_id = %s
-                ORDER BY metric, care_type, quarter, branch_id
-            """, (year, scenario, user_branch))
-        else:
-            cur.execute("""
-                SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
-                       scenario, value, version, created_at, updated_at
-                FROM budget.budget_assumptions 
-                WHERE year = %s AND scenario = %s AND is_last_value = TRUE
-                ORDER BY metric, care_type, quarter, branch_id
-            """, (year, scenario))
-        
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        
-        # Convert to list of dicts
-        data = []
-        for row in rows:
-            data.append({
-                'id': row['id'],
-                'metric': row['metric'],
-                'care_type': row['care_type'],
-                'year': row['year'],
-                'quarter': row['quarter'],
-                'input_type': row['input_type'],
-                'branch_id': row['branch_id'],
-                'scenario': row['scenario'],
-                'value': float(row['value']) if row['value'] else None,
-                'version': row['version'],
-                'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
-            })
-        
-        return jsonify({
+        with _db() as (conn, cur):
+            # Filter by branch if user has one assigned (and is not admin)
+            if user_branch and user_role != 'admin':
+                cur.execute("""
+                    SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
+                           scenario, NULLIF(value, 0)::float8 AS value, version, created_at, updated_at
+                    FROM budget.budget_assumptions 
+                    WHERE year = %s AND scenario = %s AND is_last_value = TRUE AND branch_id = %s
+                    ORDER BY metric, care_type, quarter, branch_id
+                """, (year, scenario, user_branch))
+            else:
+                cur.execute("""
+                    SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
+                           scenario, NULLIF(value, 0)::float8 AS value, version, created_at, updated_at
+                    FROM budget.budget_assumptions 
+                    WHERE year = %s AND scenario = %s AND is_last_value = TRUE
+                    ORDER BY metric, care_type, quarter, branch_id
+                """, (year, scenario))
+        
+            # Rows arrive ready to serialize: zero values come back as NULL and
+            # orjson writes the timestamps in isoformat()
+            data = cur.fetchall()
+        
+        return ojsonify({
             'year': year,
             'scenario': scenario,
             'exists': len(data) > 0,
             'data': data
-        })
-    except Exception as e:
+        }, option=ORJSON_ISO_OPTIONS)
+    except Exception:
         # Return empty data if DB not available - allows template generation
-        print(f"Warning: Could not fetch budget data - {e}")
+        logger.warning("Could not fetch budget data", exc_info=True)
         return jsonify({
             'year': year,
             'scenario': request.args.get('scenario', 'most_likely'),
@@ -912,6 +1136,10 @@ def get_budget_data(year):
         })
 
 
+# Rows per round-trip when streaming budget history
+HISTORY_FETCH_SIZE = 2000
+
+
 @app.route('/api/budget/history/<int:year>', methods=['GET'])
 @login_required
 def get_budget_history(year):
@@ -926,67 +1154,111 @@ def get_budget_history(year):
         user_branch = session.get('branch_id')
         user_role = session.get('role')
             
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # History can span every version of every assumption, so stream it from a
+        # server-side cursor instead of holding the whole result set client-side
+        with _db(name='budget_history') as (conn, cur):
+            cur.itersize = HISTORY_FETCH_SIZE
+            # Filter by branch if user has one assigned (and is not admin)
+            if user_branch and user_role != 'admin':
+                cur.execute("""
+                    SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
+                           scenario, NULLIF(value, 0)::float8 AS value, version, is_last_value, created_at, updated_at
+                    FROM budget.budget_assumptions 
+                    WHERE year = %s AND scenario = %s AND branch_id = %s
+                    ORDER BY metric, care_type, quarter, branch_id, version DESC
+                """, (year, scenario, user_branch))
+            else:
+                cur.execute("""
+                    SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
+                           scenario, NULLIF(value, 0)::float8 AS value, version, is_last_value, created_at, updated_at
+                    FROM budget.budget_assumptions 
+                    WHERE year = %s AND scenario = %s
+                    ORDER BY metric, care_type, quarter, branch_id, version DESC
+                """, (year, scenario))
         
-        # Filter by branch if user has one assigned (and is not admin)
-        if user_branch and user_role != 'admin':
-            cur.execute("""
-                SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
-                       scenario, value, version, is_last_value, created_at, updated_at
-                FROM budget.budget_assumptions 
-                WHERE year = %s AND scenario = %s AND branch_id = %s
-                ORDER BY metric, care_type, quarter, branch_id, version DESC
-            """, (year, scenario, user_branch))
-        else:
-            cur.execute("""
-                SELECT id, metric, care_type, year, quarter, input_type, branch_id, 
-                       scenario, value, version, is_last_value, created_at, updated_at
-                FROM budget.budget_assumptions 
-                WHERE year = %s AND scenario = %s
-                ORDER BY metric, care_type, quarter, branch_id, version DESC
-            """, (year, scenario))
-        
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        
-        data = []
-        for row in rows:
-            data.append({
-                'id': row['id'],
-                'metric': row['metric'],
-                'care_type': row['care_type'],
-                'year': row['year'],
-                'quarter': row['quarter'],
-                'input_type': row['input_type'],
-                'branch_id': row['branch_id'],
-                'scenario': row['scenario'],
-                'value': float(row['value']) if row['value'] else None,
-                'version': row['version'],
-                'is_last_value': row['is_last_value'],
-                'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None
-            })
+            # Same shape as get_budget_data: rows are serialized as fetched
+            data = list(cur)
         
-        return jsonify({'year': year, 'scenario': scenario, 'history': data})
+        return ojsonify({'year': year, 'scenario': scenario, 'history': data}, option=ORJSON_ISO_OPTIONS)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+INSERT_ASSUMPTION_SQL = """
+    INSERT INTO budget.budget_assumptions
+    (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1, TRUE)
+    ON CONFLICT (metric, care_type, year, quarter, branch_id, scenario, version) DO NOTHING
+"""
+
+
+# Payloads up to this many rows are sent as one executemany() of parameterized
+# INSERTs; larger ones are streamed with COPY into a staging table instead
+COPY_THRESHOLD = 5000
+
+# Dropped automatically when the transaction ends (commit or rollback)
+CREATE_ASSUMPTION_STAGE_SQL = """
+    CREATE TEMP TABLE assumption_stage (
+        metric VARCHAR(50),
+        care_type VARCHAR(20),
+        year INTEGER,
+        quarter INTEGER,
+        input_type VARCHAR(30),
+        branch_id INTEGER,
+        scenario VARCHAR(20),
+        value DECIMAL(10, 4)
+    ) ON COMMIT DROP
+"""
+
+COPY_ASSUMPTION_STAGE_SQL = """
+    COPY assumption_stage (metric, care_type, year, quarter, input_type, branch_id, scenario, value)
+    FROM STDIN
+"""
+
+INSERT_FROM_STAGE_SQL = """
+    INSERT INTO budget.budget_assumptions
+    (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
+    SELECT metric, care_type, year, quarter, input_type, branch_id, scenario, value, 1, TRUE
+    FROM assumption_stage
+    ON CONFLICT (metric, care_type, year, quarter, branch_id, scenario, version) DO NOTHING
+"""
+
+
+def bulk_insert_assumptions(cur, rows):
+    """Insert first-version assumption rows and return the number inserted.
+
+    Each row is a (metric, care_type, year, quarter, input_type, branch_id,
+    scenario, value) tuple. Rows that already exist are skipped. Payloads
+    over COPY_THRESHOLD rows are loaded with COPY into a temporary staging
+    table and inserted from there in one statement.
+    """
+    if len(rows) > COPY_THRESHOLD:
+        cur.execute(CREATE_ASSUMPTION_STAGE_SQL)
+        with cur.copy(COPY_ASSUMPTION_STAGE_SQL) as copy:
+            for row in rows:
+                copy.write_row(row)
+        cur.execute(INSERT_FROM_STAGE_SQL)
+        inserted = cur.rowcount
+    else:
+        cur.executemany(INSERT_ASSUMPTION_SQL, rows)
+        inserted = cur.rowcount
+    
+    if inserted:
+        bump_assumptions_revision(cur)
+    return inserted
+
+
 @app.route('/api/budget', methods=['POST'])
 @login_required
 def create_budget_data():
     """Create new budget records for a year and scenario (batch insert)."""
-    conn = None
-    cur = None
     try:
-        data = request.json
+        data = json_body()
         year = data.get('year')
         scenario = data.get('scenario', 'most_likely')
         records = data.get('records', [])
         
-        print(f"POST /api/budget - year: {year}, scenario: {scenario}, records count: {len(records)}")
+        logger.info("POST /api/budget - year: %s, scenario: %s, records count: %d", year, scenario, len(records))
         
         if not year or not records:
             return jsonify({'error': 'Year and records are required'}), 400
@@ -1005,123 +1277,82 @@ def create_budget_data():
         if scenario not in SCENARIOS:
             scenario = 'most_likely'
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Skip records for other branches if user has a branch assigned (and is not admin)
+        if user_branch and user_role != 'admin':
+            records = [r for r in records if r['branch_id'] == user_branch]
         
-        inserted = 0
-        errors = []
-        for record in records:
-            # Skip records for other branches if user has a branch assigned (and is not admin)
-            if user_branch and user_role != 'admin' and record['branch_id'] != user_branch:
-                continue
-            
-            try:
-                cur.execute("""
-                    INSERT INTO budget.budget_assumptions 
-                    (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1, TRUE)
-                    ON CONFLICT (metric, care_type, year, quarter, branch_id, scenario, version) DO NOTHING
-                """, (
-                    record['metric'],
-                    record['care_type'],
-                    year,
-                    record['quarter'],
-                    record['input_type'],
-                    record['branch_id'],
-                    scenario,
-                    record.get('value')
-                ))
-                inserted += cur.rowcount
-            except Exception as insert_err:
-                errors.append(f"Error inserting {record.get('metric')}/{record.get('care_type')}/Q{record.get('quarter')}/B{record.get('branch_id')}: {str(insert_err)}")
-        
-        if errors:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            return jsonify({'error': '; '.join(errors)}), 500
+        rows = [
+            (r['metric'], r['care_type'], year, r['quarter'], r['input_type'],
+             r['branch_id'], scenario, r.get('value'))
+            for r in records
+        ]
         
-        conn.commit()
-        cur.close()
-        conn.close()
+        # One transaction for the whole payload: any bad row rolls back all of it
+        with _db(commit=True) as (conn, cur):
+            inserted = bulk_insert_assumptions(cur, rows)
         
-        print(f"POST /api/budget - inserted: {inserted}")
-        return jsonify({'success': True, 'inserted': inserted, 'scenario': scenario})
+        # Rows not inserted already existed and were skipped by ON CONFLICT
+        skipped = len(rows) - inserted
+        logger.info("POST /api/budget - inserted: %d, skipped: %d", inserted, skipped)
+        return jsonify({'success': True, 'inserted': inserted, 'skipped': skipped, 'scenario': scenario})
     except Exception as e:
-        print(f"POST /api/budget - ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+        logger.exception("POST /api/budget failed")
         return jsonify({'error': str(e)}), 500
 
 
+# Retire the current version of a record and insert its successor in one
+# round-trip. branch_id, when given, restricts the edit to that branch.
+NEW_VERSION_SQL = """
+    WITH retired AS (
+        UPDATE budget.budget_assumptions
+        SET is_last_value = FALSE, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %(id)s AND is_last_value = TRUE
+          AND (%(branch_id)s::int IS NULL OR branch_id = %(branch_id)s::int)
+        RETURNING metric, care_type, year, quarter, input_type, branch_id, scenario, version
+    )
+    INSERT INTO budget.budget_assumptions
+    (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
+    SELECT metric, care_type, year, quarter, input_type, branch_id, scenario, %(value)s::numeric, version + 1, TRUE
+    FROM retired
+    RETURNING id, version
+"""
+
+
+def current_record_exists(cur, record_id):
+    """Check whether record_id is the current version of an assumption."""
+    cur.execute("""
+        SELECT 1 FROM budget.budget_assumptions
+        WHERE id = %s AND is_last_value = TRUE
+    """, (record_id,))
+    return cur.fetchone() is not None
+
+
 @app.route('/api/budget/<int:record_id>', methods=['PUT'])
 @login_required
 def update_budget_record(record_id):
     """Update a budget record with SCD versioning."""
     try:
-        data = request.json
+        data = json_body()
         new_value = data.get('value')
         
         # Get user's branch from session
         user_branch = session.get('branch_id')
         user_role = session.get('role')
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        with _db(commit=True) as (conn, cur):
+            cur.execute(NEW_VERSION_SQL, {
+                'id': record_id,
+                'value': new_value,
+                'branch_id': user_branch if user_branch and user_role != 'admin' else None
+            })
+            new_row = cur.fetchone()
         
-        # Get current record
-        cur.execute("""
-            SELECT metric, care_type, year, quarter, input_type, branch_id, scenario, value, version
-            FROM budget.budget_assumptions 
-            WHERE id = %s AND is_last_value = TRUE
-        """, (record_id,))
-        current = cur.fetchone()
-        
-        if not current:
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Record not found'}), 404
-        
-        # Check if user has permission to edit this branch
-        if user_branch and user_role != 'admin' and current['branch_id'] != user_branch:
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'You do not have permission to edit this branch'}), 403
-        
-        # Mark current record as not last value
-        cur.execute("""
-            UPDATE budget.budget_assumptions 
-            SET is_last_value = FALSE, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (record_id,))
+            if not new_row:
+                if not current_record_exists(cur, record_id):
+                    return jsonify({'error': 'Record not found'}), 404
+                return jsonify({'error': 'You do not have permission to edit this branch'}), 403
         
-        # Insert new version
-        new_version = current['version'] + 1
-        cur.execute("""
-            INSERT INTO budget.budget_assumptions 
-            (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE)
-            RETURNING id
-        """, (
-            current['metric'],
-            current['care_type'],
-            current['year'],
-            current['quarter'],
-            current['input_type'],
-            current['branch_id'],
-            current['scenario'],
-            new_value,
-            new_version
-        ))
-        
-        new_id = cur.fetchone()['id']
-        conn.commit()
-        cur.close()
-        conn.close()
+            new_id, new_version = new_row['id'], new_row['version']
         
         return jsonify({
             'success': True,
@@ -1142,55 +1373,18 @@ def delete_budget_record(record_id):
         user_branch = session.get('branch_id')
         user_role = session.get('role')
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Get current record
-        cur.execute("""
-            SELECT metric, care_type, year, quarter, input_type, branch_id, scenario, version
-            FROM budget.budget_assumptions 
-            WHERE id = %s AND is_last_value = TRUE
-        """, (record_id,))
-        current = cur.fetchone()
-        
-        if not current:
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'Record not found'}), 404
-        
-        # Check if user has permission to delete this branch's record
-        if user_branch and user_role != 'admin' and current['branch_id'] != user_branch:
-            cur.close()
-            conn.close()
-            return jsonify({'error': 'You do not have permission to delete this record'}), 403
-        
-        # Mark current as not last
-        cur.execute("""
-            UPDATE budget.budget_assumptions 
-            SET is_last_value = FALSE, updated_at = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (record_id,))
+        with _db(commit=True) as (conn, cur):
+            # Deletion is a new version with a NULL value
+            cur.execute(NEW_VERSION_SQL, {
+                'id': record_id,
+                'value': None,
+                'branch_id': user_branch if user_branch and user_role != 'admin' else None
+            })
         
-        # Insert deletion record (with NULL value)
-        new_version = current['version'] + 1
-        cur.execute("""
-            INSERT INTO budget.budget_assumptions 
-            (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, NULL, %s, TRUE)
-        """, (
-            current['metric'],
-            current['care_type'],
-            current['year'],
-            current['quarter'],
-            current['input_type'],
-            current['branch_id'],
-            current['scenario'],
-            new_version
-        ))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+            if not cur.fetchone():
+                if not current_record_exists(cur, record_id):
+                    return jsonify({'error': 'Record not found'}), 404
+                return jsonify({'error': 'You do not have permission to delete this record'}), 403
         
         return jsonify({'success': True, 'deleted_id': record_id})
     except Exception as e:
@@ -1202,7 +1396,7 @@ def delete_budget_record(record_id):
 def batch_update_budget():
     """Batch update multiple records for a specific scenario."""
     try:
-        data = request.json
+        data = json_body()
         updates = data.get('updates', [])
         scenario = data.get('scenario', 'most_likely')
         
@@ -1213,61 +1407,69 @@ def batch_update_budget():
         if scenario not in SCENARIOS:
             scenario = 'most_likely'
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # New value per record id; the first update for an id wins, as before
+        new_values = {}
+        for update in updates:
+            try:
+                record_id = int(update.get('id'))
+            except (TypeError, ValueError):
+                continue
+            new_values.setdefault(record_id, update.get('value'))
         
         updated_count = 0
         skipped_count = 0
-        for update in updates:
-            record_id = update.get('id')
-            new_value = update.get('value')
-            
-            # Get current record
+        with _db(commit=True, row_factory=tuple_row) as (conn, cur):
+            # Fetch all current records in one query
             cur.execute("""
-                SELECT metric, care_type, year, quarter, input_type, branch_id, scenario, value, version
+                SELECT id, metric, care_type, year, quarter, input_type, branch_id, scenario, value::float8 AS value, version
                 FROM budget.budget_assumptions 
-                WHERE id = %s AND is_last_value = TRUE
-            """, (record_id,))
-            current = cur.fetchone()
+                WHERE id = ANY(%s) AND is_last_value = TRUE
+            """, (list(new_values),))
             
-            if not current:
-                continue
+            current_rows = cur.fetchall()
             
-            # Check if user has permission to edit this branch
-            if user_branch and user_role != 'admin' and current['branch_id'] != user_branch:
-                skipped_count += 1
-                continue
+            # Users assigned to a branch (non-admin) can only edit that branch;
+            # drop the other records once, before building any new versions
+            if user_branch and user_role != 'admin':
+                allowed_rows = [row for row in current_rows if row[6] == user_branch]  # row[6] is branch_id
+                skipped_count = len(current_rows) - len(allowed_rows)
+                current_rows = allowed_rows
+            
+            changed_ids = []
+            new_rows = []
+            for (record_id, metric, care_type, record_year, quarter, input_type,
+                 branch_id, record_scenario, value, version) in current_rows:
+                new_value = new_values[record_id]
+                if value != new_value:
+                    changed_ids.append(record_id)
+                    new_rows.append((
+                        metric,
+                        care_type,
+                        record_year,
+                        quarter,
+                        input_type,
+                        branch_id,
+                        record_scenario,
+                        new_value,
+                        version + 1
+                    ))
             
-            if current['value'] != new_value:
-                # Mark current as not last
+            if changed_ids:
+                # Mark current records as not last
                 cur.execute("""
                     UPDATE budget.budget_assumptions 
                     SET is_last_value = FALSE, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                """, (record_id,))
+                    WHERE id = ANY(%s)
+                """, (changed_ids,))
                 
-                # Insert new version
-                new_version = current['version'] + 1
-                cur.execute("""
+                # Insert new versions
+                cur.executemany("""
                     INSERT INTO budget.budget_assumptions 
                     (metric, care_type, year, quarter, input_type, branch_id, scenario, value, version, is_last_value)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE)
-                """, (
-                    current['metric'],
-                    current['care_type'],
-                    current['year'],
-                    current['quarter'],
-                    current['input_type'],
-                    current['branch_id'],
-                    current['scenario'],
-                    new_value,
-                    new_version
-                ))
-                updated_count += 1
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+                """, new_rows)
+                updated_count = len(new_rows)
+                bump_assumptions_revision(cur)
         
         return jsonify({'success': True, 'updated': updated_count, 'skipped': skipped_count, 'scenario': scenario})
     except Exception as e:
@@ -1277,192 +1479,191 @@ def batch_update_budget():
 # ============== Daily Budget Distribution Routes ==============
 
 def init_calendar_tables():
-    """Initialize tables for calendar factors and daily budget distribution."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Public Holidays table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.public_holidays (
-            id SERIAL PRIMARY KEY,
-            holiday_date DATE NOT NULL,
-            holiday_name VARCHAR(100) NOT NULL,
-            adjustment_factor DECIMAL(5, 2) DEFAULT 0.5,
-            year INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(holiday_date)
-        );
-    """)
-    
-    # Ramadan periods table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.ramadan_periods (
-            id SERIAL PRIMARY KEY,
-            year INTEGER NOT NULL,
-            start_date DATE NOT NULL,
-            end_date DATE NOT NULL,
-            adjustment_factor DECIMAL(5, 2) DEFAULT 0.7,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(year)
-        );
-    """)
+    """Initialize tables for calendar factors and daily budget distribution.
+    One-shot: the tables and seed rows are created in a single transaction, so
+    once day_adjustments exists there is nothing left to do.
+    """
+    with get_db_connection() as conn, conn.cursor() as cur:
+        # Fast path: already initialized, skip the DDL entirely
+        cur.execute("SELECT to_regclass('budget.day_adjustments') IS NOT NULL AS ready")
+        if cur.fetchone()['ready']:
+            return
+        
+        # Serialize first-time creation across workers starting together
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('budget_calendar_init'))")
+        
+        # Public Holidays table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.public_holidays (
+                id SERIAL PRIMARY KEY,
+                holiday_date DATE NOT NULL,
+                holiday_name VARCHAR(100) NOT NULL,
+                adjustment_factor DECIMAL(5, 2) DEFAULT 0.5,
+                year INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(holiday_date)
+            );
+        """)
     
-    # Eid periods table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.eid_periods (
-            id SERIAL PRIMARY KEY,
-            year INTEGER NOT NULL,
-            eid_type VARCHAR(20) NOT NULL,  -- 'fitr' or 'adha'
-            start_date DATE NOT NULL,
-            end_date DATE NOT NULL,
-            adjustment_factor DECIMAL(5, 2) DEFAULT 0.3,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(year, eid_type)
-        );
-    """)
+        # Ramadan periods table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.ramadan_periods (
+                id SERIAL PRIMARY KEY,
+                year INTEGER NOT NULL,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                adjustment_factor DECIMAL(5, 2) DEFAULT 0.7,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(year)
+            );
+        """)
     
-    # Day of week adjustment factors
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.day_adjustments (
-            id SERIAL PRIMARY KEY,
-            day_of_week INTEGER NOT NULL,  -- 0=Monday, 6=Sunday
-            day_name VARCHAR(10) NOT NULL,
-            adjustment_factor DECIMAL(5, 2) DEFAULT 1.0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(day_of_week)
-        );
-    """)
+        # Eid periods table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.eid_periods (
+                id SERIAL PRIMARY KEY,
+                year INTEGER NOT NULL,
+                eid_type VARCHAR(20) NOT NULL,  -- 'fitr' or 'adha'
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                adjustment_factor DECIMAL(5, 2) DEFAULT 0.3,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(year, eid_type)
+            );
+        """)
     
-    # Insert default day of week factors if not exist
-    cur.execute("SELECT COUNT(*) as cnt FROM budget.day_adjustments")
-    if cur.fetchone()['cnt'] == 0:
-        days = [
-            (0, 'Monday', 1.0),
-            (1, 'Tuesday', 1.0),
-            (2, 'Wednesday', 1.0),
-            (3, 'Thursday', 1.0),
-            (4, 'Friday', 0.5),  # Weekend in KSA
-            (5, 'Saturday', 0.6),  # Weekend in KSA
-            (6, 'Sunday', 1.0)
-        ]
-        for day_num, day_name, factor in days:
-            cur.execute("""
-                INSERT INTO budget.day_adjustments (day_of_week, day_name, adjustment_factor)
-                VALUES (%s, %s, %s)
-            """, (day_num, day_name, factor))
+        # Day of week adjustment factors
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.day_adjustments (
+                id SERIAL PRIMARY KEY,
+                day_of_week INTEGER NOT NULL,  -- 0=Monday, 6=Sunday
+                day_name VARCHAR(10) NOT NULL,
+                adjustment_factor DECIMAL(5, 2) DEFAULT 1.0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(day_of_week)
+            );
+        """)
     
-    conn.commit()
-    cur.close()
-    conn.close()
+        # Insert default day of week factors if the table is empty
+        cur.execute("""
+            INSERT INTO budget.day_adjustments (day_of_week, day_name, adjustment_factor)
+            SELECT * FROM (VALUES
+                (0, 'Monday', 1.0),
+                (1, 'Tuesday', 1.0),
+                (2, 'Wednesday', 1.0),
+                (3, 'Thursday', 1.0),
+                (4, 'Friday', 0.5),  -- Weekend in KSA
+                (5, 'Saturday', 0.6),  -- Weekend in KSA
+                (6, 'Sunday', 1.0)
+            ) AS days(day_of_week, day_name, adjustment_factor)
+            WHERE NOT EXISTS (SELECT 1 FROM budget.day_adjustments)
+            ON CONFLICT (day_of_week) DO NOTHING
+        """)
 
 
 # Initialize calendar tables
-try:
-    init_calendar_tables()
-    print("Calendar tables initialized successfully")
-except Exception as e:
-    print(f"Calendar tables initialization warning: {e}")
+if DB_AVAILABLE:
+    try:
+        init_calendar_tables()
+        logger.info("Calendar tables initialized successfully")
+    except Exception:
+        logger.warning("Calendar tables initialization failed", exc_info=True)
 
 
 # ============== Income Statement Module ==============
 
 def init_income_statement_tables():
     """Initialize income statement assumptions tables."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Line items master table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.income_statement_line_items (
-            id SERIAL PRIMARY KEY,
-            code VARCHAR(20) UNIQUE NOT NULL,
-            name VARCHAR(100) NOT NULL,
-            category VARCHAR(50) NOT NULL,
-            display_order INTEGER NOT NULL,
-            is_user_input BOOLEAN DEFAULT FALSE,
-            calculation_formula VARCHAR(500),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
+    with get_db_connection() as conn, conn.cursor() as cur:
+        # Line items master table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.income_statement_line_items (
+                id SERIAL PRIMARY KEY,
+                code VARCHAR(20) UNIQUE NOT NULL,
+                name VARCHAR(100) NOT NULL,
+                category VARCHAR(50) NOT NULL,
+                display_order INTEGER NOT NULL,
+                is_user_input BOOLEAN DEFAULT FALSE,
+                calculation_formula VARCHAR(500),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
     
-    # Assumptions table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.income_statement_assumptions (
-            id SERIAL PRIMARY KEY,
-            branch_id INTEGER NOT NULL,
-            fiscal_year INTEGER NOT NULL,
-            scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely',
-            line_item_code VARCHAR(50) NOT NULL,
-            assumption_percentage DECIMAL(10, 4) DEFAULT 0,
-            created_by INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_published BOOLEAN DEFAULT FALSE,
-            version INTEGER DEFAULT 1,
-            UNIQUE(branch_id, fiscal_year, scenario, line_item_code, version)
-        );
-    """)
+        # Assumptions table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.income_statement_assumptions (
+                id SERIAL PRIMARY KEY,
+                branch_id INTEGER NOT NULL,
+                fiscal_year INTEGER NOT NULL,
+                scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely',
+                line_item_code VARCHAR(50) NOT NULL,
+                assumption_percentage DECIMAL(10, 4) DEFAULT 0,
+                created_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_published BOOLEAN DEFAULT FALSE,
+                version INTEGER DEFAULT 1,
+                UNIQUE(branch_id, fiscal_year, scenario, line_item_code, version)
+            );
+        """)
     
-    # Budget calculated values table (monthly breakdown)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS budget.income_statement_budget (
-            id SERIAL PRIMARY KEY,
-            branch_id INTEGER NOT NULL,
-            fiscal_year INTEGER NOT NULL,
-            scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely',
-            line_item_code VARCHAR(50) NOT NULL,
-            assumption_percentage DECIMAL(10, 4) DEFAULT 0,
-            month_1 DECIMAL(18, 2) DEFAULT 0,
-            month_2 DECIMAL(18, 2) DEFAULT 0,
-            month_3 DECIMAL(18, 2) DEFAULT 0,
-            month_4 DECIMAL(18, 2) DEFAULT 0,
-            month_5 DECIMAL(18, 2) DEFAULT 0,
-            month_6 DECIMAL(18, 2) DEFAULT 0,
-            month_7 DECIMAL(18, 2) DEFAULT 0,
-            month_8 DECIMAL(18, 2) DEFAULT 0,
-            month_9 DECIMAL(18, 2) DEFAULT 0,
-            month_10 DECIMAL(18, 2) DEFAULT 0,
-            month_11 DECIMAL(18, 2) DEFAULT 0,
-            month_12 DECIMAL(18, 2) DEFAULT 0,
-            fy_total DECIMAL(18, 2) DEFAULT 0,
-            published_at TIMESTAMP,
-            published_by INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(branch_id, fiscal_year, scenario, line_item_code)
-        );
-    """)
+        # Budget calculated values table (monthly breakdown)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS budget.income_statement_budget (
+                id SERIAL PRIMARY KEY,
+                branch_id INTEGER NOT NULL,
+                fiscal_year INTEGER NOT NULL,
+                scenario VARCHAR(20) NOT NULL DEFAULT 'most_likely',
+                line_item_code VARCHAR(50) NOT NULL,
+                assumption_percentage DECIMAL(10, 4) DEFAULT 0,
+                month_1 DECIMAL(18, 2) DEFAULT 0,
+                month_2 DECIMAL(18, 2) DEFAULT 0,
+                month_3 DECIMAL(18, 2) DEFAULT 0,
+                month_4 DECIMAL(18, 2) DEFAULT 0,
+                month_5 DECIMAL(18, 2) DEFAULT 0,
+                month_6 DECIMAL(18, 2) DEFAULT 0,
+                month_7 DECIMAL(18, 2) DEFAULT 0,
+                month_8 DECIMAL(18, 2) DEFAULT 0,
+                month_9 DECIMAL(18, 2) DEFAULT 0,
+                month_10 DECIMAL(18, 2) DEFAULT 0,
+                month_11 DECIMAL(18, 2) DEFAULT 0,
+                month_12 DECIMAL(18, 2) DEFAULT 0,
+                fy_total DECIMAL(18, 2) DEFAULT 0,
+                published_at TIMESTAMP,
+                published_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(branch_id, fiscal_year, scenario, line_item_code)
+            );
+        """)
     
-    # Alter existing tables to increase line_item_code column size (if needed)
-    cur.execute("""
-        ALTER TABLE budget.income_statement_assumptions 
-        ALTER COLUMN line_item_code TYPE VARCHAR(50);
-    """)
-    cur.execute("""
-        ALTER TABLE budget.income_statement_budget 
-        ALTER COLUMN line_item_code TYPE VARCHAR(50);
-    """)
+        # Alter existing tables to increase line_item_code column size (if needed)
+        cur.execute("""
+            ALTER TABLE budget.income_statement_assumptions 
+            ALTER COLUMN line_item_code TYPE VARCHAR(50);
+        """)
+        cur.execute("""
+            ALTER TABLE budget.income_statement_budget 
+            ALTER COLUMN line_item_code TYPE VARCHAR(50);
+        """)
     
-    # Create indexes
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_is_assumptions_lookup 
-        ON budget.income_statement_assumptions(branch_id, fiscal_year, scenario, is_published);
+        # Create indexes
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_is_assumptions_lookup 
+            ON budget.income_statement_assumptions(branch_id, fiscal_year, scenario, is_published);
         
-        CREATE INDEX IF NOT EXISTS idx_is_budget_lookup 
-        ON budget.income_statement_budget(branch_id, fiscal_year, scenario);
-    """)
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+            CREATE INDEX IF NOT EXISTS idx_is_budget_lookup 
+            ON budget.income_statement_budget(branch_id, fiscal_year, scenario);
+        """)
 
 # Initialize income statement tables
-try:
-    init_income_statement_tables()
-    print("Income statement tables initialized successfully")
-except Exception as e:
-    print(f"Income statement tables initialization warning: {e}")
+if DB_AVAILABLE:
+    try:
+        init_income_statement_tables()
+        logger.info("Income statement tables initialized successfully")
+    except Exception:
+        logger.warning("Income statement tables initialization failed", exc_info=True)
 
 
 @app.route('/api/income-statement/years', methods=['GET'])
@@ -1472,27 +1673,22 @@ def get_income_statement_years():
     try:
         published_only = request.args.get('published', 'false').lower() == 'true'
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if published_only:
-            cur.execute("""
-                SELECT DISTINCT fiscal_year 
-                FROM budget.income_statement_assumptions 
-                WHERE is_published = TRUE
-                ORDER BY fiscal_year DESC
-            """)
-        else:
-            cur.execute("""
-                SELECT DISTINCT fiscal_year 
-                FROM budget.income_statement_assumptions 
-                ORDER BY fiscal_year DESC
-            """)
-        
-        years = [row['fiscal_year'] for row in cur.fetchall()]
+        with _db(row_factory=tuple_row) as (conn, cur):
+            if published_only:
+                cur.execute("""
+                    SELECT DISTINCT fiscal_year 
+                    FROM budget.income_statement_assumptions 
+                    WHERE is_published = TRUE
+                    ORDER BY fiscal_year DESC
+                """)
+            else:
+                cur.execute("""
+                    SELECT DISTINCT fiscal_year 
+                    FROM budget.income_statement_assumptions 
+                    ORDER BY fiscal_year DESC
+                """)
         
-        cur.close()
-        conn.close()
+            years = [row[0] for row in cur.fetchall()]
         
         return jsonify({'years': years})
         
@@ -1523,7 +1719,7 @@ def get_income_statement_revenue(branch_id, year):
             GROUP BY CareType, StayType
         """
         
-        print(f"Income Statement Revenue Query - Year: {year}, Branch: {branch_id}, Scenario: {scenario}")
+        logger.info("Income Statement Revenue Query - Year: %s, Branch: %s, Scenario: %s", year, branch_id, scenario)
         
         result = ch_client.query(query, parameters={
             'year': year,
@@ -1533,14 +1729,14 @@ def get_income_statement_revenue(branch_id, year):
         
         revenue = {'IP': 0, 'OP': 0, 'ER': 0}
         
-        print(f"Query returned {len(result.result_rows)} rows")
+        logger.debug("Query returned %d rows", len(result.result_rows))
         
         for row in result.result_rows:
             care_type = row[0]
             stay_type = row[1]
             total = float(row[2] or 0)
             
-            print(f"  CareType: {care_type}, StayType: {stay_type}, Revenue: {total}")
+            logger.debug("  CareType: %s, StayType: %s, Revenue: %s", care_type, stay_type, total)
             
             # Map based on CareType and StayType
             if care_type == 'OP':
@@ -1551,7 +1747,7 @@ def get_income_statement_revenue(branch_id, year):
                 # Inpatient includes Non-LTC and LTC stay types
                 revenue['IP'] += total
         
-        print(f"Final revenue: IP={revenue['IP']}, OP={revenue['OP']}, ER={revenue['ER']}")
+        logger.info("Final revenue: IP=%s, OP=%s, ER=%s", revenue['IP'], revenue['OP'], revenue['ER'])
         
         # If no data found, try without scenario filter to check if data exists
         if all(v == 0 for v in revenue.values()):
@@ -1563,7 +1759,7 @@ def get_income_statement_revenue(branch_id, year):
             check_result = ch_client.query(check_query, parameters={'year': year, 'branch_id': branch_id})
             if check_result.result_rows:
                 cnt, total = check_result.result_rows[0]
-                print(f"Check without scenario filter: {cnt} rows, total revenue: {total}")
+                logger.debug("Check without scenario filter: %s rows, total revenue: %s", cnt, total)
         
         return jsonify({
             'success': True,
@@ -1574,7 +1770,7 @@ def get_income_statement_revenue(branch_id, year):
         })
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Income statement revenue query failed")
         return jsonify({
             'error': str(e),
             'revenue': {'IP': 0, 'OP': 0, 'ER': 0}
@@ -1606,7 +1802,7 @@ def get_income_statement_revenue_monthly(branch_id, year):
             ORDER BY Month_, CareType
         """
         
-        print(f"Monthly Revenue Query - Year: {year}, Branch: {branch_id}, Scenario: {scenario}")
+        logger.info("Monthly Revenue Query - Year: %s, Branch: %s, Scenario: %s", year, branch_id, scenario)
         
         result = ch_client.query(query, parameters={
             'year': year,
@@ -1614,7 +1810,7 @@ def get_income_statement_revenue_monthly(branch_id, year):
             'scenario': scenario
         })
         
-        print(f"Query returned {len(result.result_rows)} rows")
+        logger.debug("Query returned %d rows", len(result.result_rows))
         
         # Initialize revenue structure: { month: { IP, OP, ER } }
         monthly_revenue = {}
@@ -1626,7 +1822,7 @@ def get_income_statement_revenue_monthly(branch_id, year):
             care_type = row[1]
             total = float(row[2] or 0)
             
-            print(f"  Month: {month}, CareType: {care_type}, Revenue: {total:,.0f}")
+            logger.debug("  Month: %d, CareType: %s, Revenue: %.0f", month, care_type, total)
             
             # Map based on CareType
             if care_type == 'OP':
@@ -1641,7 +1837,8 @@ def get_income_statement_revenue_monthly(branch_id, year):
         total_ip = sum(m['IP'] for m in monthly_revenue.values())
         total_op = sum(m['OP'] for m in monthly_revenue.values())
         total_er = sum(m['ER'] for m in monthly_revenue.values())
-        print(f"Total Revenue - IP: {total_ip:,.0f}, OP: {total_op:,.0f}, ER: {total_er:,.0f}, Total: {total_ip + total_op + total_er:,.0f}")
+        logger.info("Total Revenue - IP: %.0f, OP: %.0f, ER: %.0f, Total: %.0f",
+                    total_ip, total_op, total_er, total_ip + total_op + total_er)
         
         # If no data found, check without is_last_value filter
         if all(m['IP'] == 0 and m['OP'] == 0 and m['ER'] == 0 for m in monthly_revenue.values()):
@@ -1657,7 +1854,7 @@ def get_income_statement_revenue_monthly(branch_id, year):
             })
             if check_result.result_rows:
                 cnt, total = check_result.result_rows[0]
-                print(f"Check without is_last_value filter: {cnt} rows, total revenue: {total:,.0f}" if total else f"Check without filter: {cnt} rows, no revenue")
+                logger.debug("Check without is_last_value filter: %s rows, total revenue: %s", cnt, total or 0)
         
         return jsonify({
             'success': True,
@@ -1668,7 +1865,7 @@ def get_income_statement_revenue_monthly(branch_id, year):
         })
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Income statement monthly revenue query failed")
         return jsonify({
             'error': str(e),
             'monthly_revenue': {}
@@ -1687,47 +1884,42 @@ def get_income_statement_assumptions():
         if not branch_id or not year:
             return jsonify({'error': 'branch_id and year are required'}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # First get the max version
-        cur.execute("""
-            SELECT MAX(version) as max_version
-            FROM budget.income_statement_assumptions 
-            WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
-        """, (branch_id, year, scenario))
-        
-        version_row = cur.fetchone()
-        max_version = version_row['max_version'] if version_row and version_row['max_version'] else 0
+        with _db() as (conn, cur):
+            # First get the max version
+            cur.execute("""
+                SELECT MAX(version) as max_version
+                FROM budget.income_statement_assumptions 
+                WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
+            """, (branch_id, year, scenario))
         
-        cur.execute("""
-            SELECT line_item_code, assumption_percentage, is_published, updated_at
-            FROM budget.income_statement_assumptions
-            WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
-              AND version = (
-                  SELECT MAX(version) 
-                  FROM budget.income_statement_assumptions 
-                  WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
-              )
-        """, (branch_id, year, scenario, branch_id, year, scenario))
-        
-        rows = cur.fetchall()
-        
-        assumptions = []
-        is_published = False
-        last_updated = None
-        
-        for row in rows:
-            assumptions.append({
-                'line_item_code': row['line_item_code'],
-                'assumption_percentage': float(row['assumption_percentage'] or 0)
-            })
-            is_published = row['is_published']
-            if row['updated_at']:
-                last_updated = row['updated_at'].isoformat() if hasattr(row['updated_at'], 'isoformat') else str(row['updated_at'])
+            version_row = cur.fetchone()
+            max_version = version_row['max_version'] if version_row and version_row['max_version'] else 0
         
-        cur.close()
-        conn.close()
+            cur.execute("""
+                SELECT line_item_code, assumption_percentage, is_published, updated_at
+                FROM budget.income_statement_assumptions
+                WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
+                  AND version = (
+                      SELECT MAX(version) 
+                      FROM budget.income_statement_assumptions 
+                      WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
+                  )
+            """, (branch_id, year, scenario, branch_id, year, scenario))
+        
+            rows = cur.fetchall()
+        
+            assumptions = []
+            is_published = False
+            last_updated = None
+        
+            for row in rows:
+                assumptions.append({
+                    'line_item_code': row['line_item_code'],
+                    'assumption_percentage': float(row['assumption_percentage'] or 0)
+                })
+                is_published = row['is_published']
+                if row['updated_at']:
+                    last_updated = row['updated_at'].isoformat() if hasattr(row['updated_at'], 'isoformat') else str(row['updated_at'])
         
         return jsonify({
             'success': True,
@@ -1741,7 +1933,7 @@ def get_income_statement_assumptions():
         })
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Loading income statement assumptions failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1750,7 +1942,7 @@ def get_income_statement_assumptions():
 def save_income_statement_assumptions():
     """Save or update income statement assumptions for multiple branches."""
     try:
-        data = request.json
+        data = json_body()
         is_published = data.get('publish', False)
         assumptions_list = data.get('assumptions', [])
         
@@ -1759,61 +1951,55 @@ def save_income_statement_assumptions():
         
         user_id = session.get('user_id')
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Group assumptions by branch to handle versioning per branch
-        branches_data = {}
-        for assumption in assumptions_list:
-            branch_id = assumption.get('branch_id')
-            year = assumption.get('year')
-            scenario = assumption.get('scenario', 'most_likely')
-            key = (branch_id, year, scenario)
-            if key not in branches_data:
-                branches_data[key] = []
-            branches_data[key].append(assumption)
-        
-        # Process each branch separately
-        for (branch_id, year, scenario), branch_assumptions in branches_data.items():
-            # Get current max version for this branch
-            cur.execute("""
-                SELECT COALESCE(MAX(version), 0) as max_version
-                FROM budget.income_statement_assumptions
-                WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
-            """, (branch_id, year, scenario))
+        with _db(commit=True) as (conn, cur):
+            # Group assumptions by branch to handle versioning per branch
+            branches_data = {}
+            for assumption in assumptions_list:
+                branch_id = assumption.get('branch_id')
+                year = assumption.get('year')
+                scenario = assumption.get('scenario', 'most_likely')
+                key = (branch_id, year, scenario)
+                if key not in branches_data:
+                    branches_data[key] = []
+                branches_data[key].append(assumption)
+        
+            # Process each branch separately
+            for (branch_id, year, scenario), branch_assumptions in branches_data.items():
+                # Get current max version for this branch
+                cur.execute("""
+                    SELECT COALESCE(MAX(version), 0) as max_version
+                    FROM budget.income_statement_assumptions
+                    WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
+                """, (branch_id, year, scenario))
             
-            current_version = cur.fetchone()['max_version']
-            new_version = current_version + 1 if is_published else max(current_version, 1)
+                current_version = cur.fetchone()['max_version']
+                new_version = current_version + 1 if is_published else max(current_version, 1)
             
-            for assumption in branch_assumptions:
-                line_item_code = assumption.get('line_item_code')
-                # Accept both assumption_percentage and assumption_value
-                percentage = assumption.get('assumption_percentage') or assumption.get('assumption_value', 0)
+                for assumption in branch_assumptions:
+                    line_item_code = assumption.get('line_item_code')
+                    # Accept both assumption_percentage and assumption_value
+                    percentage = assumption.get('assumption_percentage') or assumption.get('assumption_value', 0)
                 
-                if is_published:
-                    # Insert new version
-                    cur.execute("""
-                        INSERT INTO budget.income_statement_assumptions 
-                        (branch_id, fiscal_year, scenario, line_item_code, assumption_percentage, 
-                         created_by, is_published, version, updated_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                    """, (branch_id, year, scenario, line_item_code, percentage, user_id, True, new_version))
-                else:
-                    # Upsert current version (draft)
-                    cur.execute("""
-                        INSERT INTO budget.income_statement_assumptions 
-                        (branch_id, fiscal_year, scenario, line_item_code, assumption_percentage, 
-                         created_by, is_published, version, updated_at)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                        ON CONFLICT (branch_id, fiscal_year, scenario, line_item_code, version)
-                        DO UPDATE SET 
-                            assumption_percentage = EXCLUDED.assumption_percentage,
-                            updated_at = CURRENT_TIMESTAMP
-                    """, (branch_id, year, scenario, line_item_code, percentage, user_id, False, new_version))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+                    if is_published:
+                        # Insert new version
+                        cur.execute("""
+                            INSERT INTO budget.income_statement_assumptions 
+                            (branch_id, fiscal_year, scenario, line_item_code, assumption_percentage, 
+                             created_by, is_published, version, updated_at)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                        """, (branch_id, year, scenario, line_item_code, percentage, user_id, True, new_version))
+                    else:
+                        # Upsert current version (draft)
+                        cur.execute("""
+                            INSERT INTO budget.income_statement_assumptions 
+                            (branch_id, fiscal_year, scenario, line_item_code, assumption_percentage, 
+                             created_by, is_published, version, updated_at)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                            ON CONFLICT (branch_id, fiscal_year, scenario, line_item_code, version)
+                            DO UPDATE SET 
+                                assumption_percentage = EXCLUDED.assumption_percentage,
+                                updated_at = CURRENT_TIMESTAMP
+                        """, (branch_id, year, scenario, line_item_code, percentage, user_id, False, new_version))
         
         return jsonify({
             'success': True,
@@ -1821,7 +2007,7 @@ def save_income_statement_assumptions():
         })
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Saving income statement assumptions failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1838,58 +2024,53 @@ def get_income_statement_budget():
         if not year:
             return jsonify({'error': 'year is required'}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if consolidated:
-            # Get aggregated data across all branches
-            cur.execute("""
-                SELECT 
-                    line_item_code,
-                    AVG(assumption_percentage) as assumption_percentage,
-                    SUM(month_1) as month_1, SUM(month_2) as month_2, SUM(month_3) as month_3,
-                    SUM(month_4) as month_4, SUM(month_5) as month_5, SUM(month_6) as month_6,
-                    SUM(month_7) as month_7, SUM(month_8) as month_8, SUM(month_9) as month_9,
-                    SUM(month_10) as month_10, SUM(month_11) as month_11, SUM(month_12) as month_12,
-                    SUM(fy_total) as fy_total
-                FROM budget.income_statement_budget
-                WHERE fiscal_year = %s AND scenario = %s
-                GROUP BY line_item_code
-            """, (year, scenario))
-        else:
-            cur.execute("""
-                SELECT 
-                    line_item_code, assumption_percentage,
-                    month_1, month_2, month_3, month_4, month_5, month_6,
-                    month_7, month_8, month_9, month_10, month_11, month_12,
-                    fy_total
-                FROM budget.income_statement_budget
-                WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
-            """, (branch_id, year, scenario))
-        
-        rows = cur.fetchall()
-        
-        budget = {}
-        for row in rows:
-            budget[row['line_item_code']] = {
-                'assumption': float(row['assumption_percentage'] or 0),
-                'month_1': float(row['month_1'] or 0),
-                'month_2': float(row['month_2'] or 0),
-                'month_3': float(row['month_3'] or 0),
-                'month_4': float(row['month_4'] or 0),
-                'month_5': float(row['month_5'] or 0),
-                'month_6': float(row['month_6'] or 0),
-                'month_7': float(row['month_7'] or 0),
-                'month_8': float(row['month_8'] or 0),
-                'month_9': float(row['month_9'] or 0),
-                'month_10': float(row['month_10'] or 0),
-                'month_11': float(row['month_11'] or 0),
-                'month_12': float(row['month_12'] or 0),
-                'fy_total': float(row['fy_total'] or 0)
-            }
-        
-        cur.close()
-        conn.close()
+        with _db() as (conn, cur):
+            if consolidated:
+                # Get aggregated data across all branches
+                cur.execute("""
+                    SELECT 
+                        line_item_code,
+                        AVG(assumption_percentage) as assumption_percentage,
+                        SUM(month_1) as month_1, SUM(month_2) as month_2, SUM(month_3) as month_3,
+                        SUM(month_4) as month_4, SUM(month_5) as month_5, SUM(month_6) as month_6,
+                        SUM(month_7) as month_7, SUM(month_8) as month_8, SUM(month_9) as month_9,
+                        SUM(month_10) as month_10, SUM(month_11) as month_11, SUM(month_12) as month_12,
+                        SUM(fy_total) as fy_total
+                    FROM budget.income_statement_budget
+                    WHERE fiscal_year = %s AND scenario = %s
+                    GROUP BY line_item_code
+                """, (year, scenario))
+            else:
+                cur.execute("""
+                    SELECT 
+                        line_item_code, assumption_percentage,
+                        month_1, month_2, month_3, month_4, month_5, month_6,
+                        month_7, month_8, month_9, month_10, month_11, month_12,
+                        fy_total
+                    FROM budget.income_statement_budget
+                    WHERE branch_id = %s AND fiscal_year = %s AND scenario = %s
+                """, (branch_id, year, scenario))
+        
+            rows = cur.fetchall()
+        
+            budget = {}
+            for row in rows:
+                budget[row['line_item_code']] = {
+                    'assumption': float(row['assumption_percentage'] or 0),
+                    'month_1': float(row['month_1'] or 0),
+                    'month_2': float(row['month_2'] or 0),
+                    'month_3': float(row['month_3'] or 0),
+                    'month_4': float(row['month_4'] or 0),
+                    'month_5': float(row['month_5'] or 0),
+                    'month_6': float(row['month_6'] or 0),
+                    'month_7': float(row['month_7'] or 0),
+                    'month_8': float(row['month_8'] or 0),
+                    'month_9': float(row['month_9'] or 0),
+                    'month_10': float(row['month_10'] or 0),
+                    'month_11': float(row['month_11'] or 0),
+                    'month_12': float(row['month_12'] or 0),
+                    'fy_total': float(row['fy_total'] or 0)
+                }
         
         return jsonify({
             'success': True,
@@ -1901,12 +2082,43 @@ def get_income_statement_budget():
         })
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Income statement budget query failed")
         return jsonify({'error': str(e)}), 500
 
 
 # ============== Daily Budget Distribution Calculation ==============
 
+# Calculated rows kept for a follow-up publish, so the page does not have to
+# upload them again. One entry per admin (only admins can publish), per worker
+# process; a publish that misses asks the page to send the rows instead.
+PUBLISH_CACHE_TTL = 600  # seconds
+_publish_cache = {}
+_publish_cache_lock = threading.Lock()
+
+
+def cache_publish_rows(username, params, rows):
+    """Keep rows for username's next publish and return the key to publish them with.
+    params is (year, quarters, scenario); a publish must repeat them to use the rows."""
+    key = secrets.token_urlsafe(16)
+    now = time.monotonic()
+    with _publish_cache_lock:
+        for user in [u for u, entry in _publish_cache.items() if entry['expires'] < now]:
+            del _publish_cache[user]
+        _publish_cache[username] = {'key': key, 'params': params, 'rows': rows, 'expires': now + PUBLISH_CACHE_TTL}
+    return key
+
+
+def pop_publish_rows(username, key, params):
+    """Return and forget the rows cached under key, or None if missing, expired or not matching."""
+    with _publish_cache_lock:
+        entry = _publish_cache.get(username)
+        if (entry is None or entry['key'] != key or entry['params'] != params
+                or entry['expires'] < time.monotonic()):
+            return None
+        del _publish_cache[username]
+    return entry['rows']
+
+
 @app.route('/api/daily-budget/calculate', methods=['POST'])
 @login_required
 def calculate_daily_budget():
@@ -1915,9 +2127,10 @@ def calculate_daily_budget():
     Quarter is optional - if not provided, calculates for all 4 quarters (full year).
     Uses pre-calculated weights from vw_actual_for_weghit (avg of last 2 years).
     Maps days by weekday position in month (1st Sunday = 1st Sunday, etc.)
+    The per-speciality detail rows are only returned with ?include_detail=1.
     """
     try:
-        data = request.json
+        data = json_body()
         year = data.get('year')
         quarter = data.get('quarter')  # Optional - None means full year
         scenario = data.get('scenario', 'most_likely')
@@ -1959,296 +2172,251 @@ def calculate_daily_budget():
             budget_query += ' AND BranchId = {branch_id:UInt8}'
             query_params['branch_id'] = branch_id
         
-        budget_result = ch_client.query(budget_query, parameters=query_params)
-        budget_columns = budget_result.column_names
-        budget_data = [dict(zip(budget_columns, row)) for row in budget_result.result_rows]
+        budget_df = query_frame(ch_client, budget_query, query_params)
         
-        if not budget_data:
+        if budget_df.empty:
             return jsonify({'error': 'No budget data found for the specified criteria'}), 404
         
+        # Measures as floats once for the whole frame (NULL -> 0)
+        for column in ('Census', 'Episodes', 'CPE_Budget', 'ALOS', 'Revenue'):
+            budget_df[column] = budget_df[column].fillna(0).astype(float)
+        
         # Calculate source totals for verification
-        source_total_revenue = sum(float(row.get('Revenue') or 0) for row in budget_data)
-        source_total_census = sum(float(row.get('Census') or 0) for row in budget_data)
+        source_total_revenue = float(budget_df['Revenue'].sum())
+        source_total_census = float(budget_df['Census'].sum())
         
         # Step 2: Get actuals data from vw_actual_for_weight (avg of last 2 years)
         # Structure: BranchId, Month_, Day_, CareType, StayType, Speciality, Census, Revenue
         # Census weight is used for both Census and Episodes distribution
+        # Only fetch the branches and quarters present in the budget; weights are
+        # normalized within Branch/CareType/StayType/Quarter, so skipping other
+        # groups does not change the ones we use
         weights_query = """
             SELECT BranchId, Month_, Day_, CareType, StayType, Speciality, 
                    Census, Revenue
             FROM budget.vw_actual_for_weight
+            WHERE BranchId IN {branch_ids:Array(UInt8)}
+              AND intDiv(Month_ - 1, 3) + 1 IN {quarters:Array(UInt8)}
         """
-        weights_result = ch_client.query(weights_query)
-        weights_columns = weights_result.column_names
-        raw_weights_data = [dict(zip(weights_columns, row)) for row in weights_result.result_rows]
+        weights_params = {
+            'branch_ids': sorted(budget_df['BranchId'].unique().tolist()),
+            'quarters': sorted(budget_df['Quarter'].unique().tolist())
+        }
+        weights_df = query_frame(ch_client, weights_query, weights_params)
         
         # Calculate All_Revenue (total per Branch/CareType/StayType/Quarter)
         # and Weight = Revenue / All_Revenue
         # Also calculate Census weight for episodes distribution
+        # Vectorized with pandas on the columnar weights frame
         from collections import defaultdict
         
-        # First pass: Calculate All_Revenue and All_Census per Branch/CareType/StayType for each quarter
-        total_revenue_by_group_quarter = defaultdict(float)
-        total_census_by_group_quarter = defaultdict(float)
-        for w in raw_weights_data:
-            month = w['Month_']
-            q = (month - 1) // 3 + 1  # Determine quarter from month
-            key = (w['BranchId'], w['CareType'], w['StayType'], q)
-            total_revenue_by_group_quarter[key] += float(w['Revenue'] or 0)
-            total_census_by_group_quarter[key] += float(w['Census'] or 0)
-        
-        # Second pass: Add calculated All_Revenue, Weight, and Census_Weight to each record
+        weights_df['Revenue'] = weights_df['Revenue'].fillna(0).astype(float)
+        weights_df['Census'] = weights_df['Census'].fillna(0).astype(float)
+        weights_df['Quarter'] = (weights_df['Month_'].astype(int) - 1) // 3 + 1  # Determine quarter from month
+        
+        # All_Revenue and All_Census per Branch/CareType/StayType for each quarter
+        group = weights_df.groupby(['BranchId', 'CareType', 'StayType', 'Quarter'], dropna=False, sort=False)
+        weights_df['All_Revenue'] = group['Revenue'].transform('sum')
+        weights_df['All_Census'] = group['Census'].transform('sum')
+        
         # Weight = Revenue / All_Revenue (for revenue distribution)
         # Census_Weight = Census / All_Census (for episodes distribution)
-        weights_data = []
-        for w in raw_weights_data:
-            month = w['Month_']
-            q = (month - 1) // 3 + 1
-            key = (w['BranchId'], w['CareType'], w['StayType'], q)
-            all_revenue = total_revenue_by_group_quarter.get(key, 0)
-            all_census = total_census_by_group_quarter.get(key, 0)
-            weight = float(w['Revenue'] or 0) / all_revenue if all_revenue > 0 else 0
-            census_weight = float(w['Census'] or 0) / all_census if all_census > 0 else 0
-            w['All_Revenue'] = all_revenue
-            w['All_Census'] = all_census
-            w['Weight'] = weight
-            w['Census_Weight'] = census_weight
-            w['Quarter'] = q  # Add quarter to weight record
-            weights_data.append(w)
-        
-        # Step 3: Generate dates and map to weekday positions
-        from calendar import monthrange
-        
-        def get_weekday_position(d):
-            """Get the position of this weekday in the month (1st Sunday, 2nd Monday, etc.)"""
-            day_of_week = d.weekday()  # 0=Monday, 6=Sunday
-            day_of_month = d.day
-            position = (day_of_month - 1) // 7 + 1
-            return position
-        
-        def get_calendar_factor(check_date):
-            """Get the adjustment factor for a specific date using automatic Hijri calendar detection."""
-            return get_calendar_adjustment_factor(check_date)
-        
-        # Generate all dates for the requested period (quarter or full year)
-        # Build a dict: {quarter: [date_info, ...]}
+        all_revenue = weights_df['All_Revenue'].to_numpy(dtype=float)
+        all_census = weights_df['All_Census'].to_numpy(dtype=float)
+        weights_df['Weight'] = np.divide(weights_df['Revenue'].to_numpy(dtype=float), all_revenue,
+                                         out=np.zeros(len(weights_df)), where=all_revenue > 0)
+        weights_df['Census_Weight'] = np.divide(weights_df['Census'].to_numpy(dtype=float), all_census,
+                                                out=np.zeros(len(weights_df)), where=all_census > 0)
+        weights_data = weights_df.to_dict('records')
+        
+        # Index weights by Branch/CareType/StayType/Quarter so each budget row
+        # only visits its own group instead of scanning every weight row
+        weights_by_group = defaultdict(list)
+        for w in weights_data:
+            weights_by_group[(w['BranchId'], w['CareType'], w['StayType'], w['Quarter'])].append(w)
+        
+        # Step 3: Build the year's calendar as columnar arrays in one vectorized pass
+        year_days = np.arange(np.datetime64(f'{year}-01-01'), np.datetime64(f'{year + 1}-01-01'),
+                              dtype='datetime64[D]')
+        month_starts = year_days.astype('datetime64[M]')
+        day_months = month_starts.astype(np.int64) % 12 + 1
+        day_positions = (year_days - month_starts).astype(np.int64) // 7 + 1  # 1st, 2nd, 3rd, etc.
+        day_quarters = (day_months - 1) // 3 + 1
+        day_factors = calendar_factor_array(year)[:len(year_days)]
+        day_strs = year_days.astype(str)
+        
+        # Slice the calendar per requested quarter: date strings, the date
+        # positions for each (month, day position) slot, calendar factors, and
+        # the even-distribution weights used when a budget row has no weight data
         dates_by_quarter = {}
+        no_dates = np.empty(0, dtype=np.intp)
         for q in quarters_to_process:
-            q_start_month = (q - 1) * 3 + 1
-            q_end_month = q * 3
-            dates_by_quarter[q] = []
-            for month in range(q_start_month, q_end_month + 1):
-                last_day = monthrange(year, month)[1]
-                for day in range(1, last_day + 1):
-                    d = date(year, month, day)
-                    dates_by_quarter[q].append({
-                        'date': d,
-                        'month': month,
-                        'quarter': q,
-                        'day_position': get_weekday_position(d),  # 1st, 2nd, 3rd, etc.
-                        'calendar_factor': get_calendar_factor(d)
-                    })
-        
-        # Step 5: Build weight lookup by (BranchId, Month, DayPosition, CareType, StayType, Speciality)
-        weight_lookup = {}
-        for w in weights_data:
-            key = (
-                w['BranchId'],
-                w['Month_'],
-                w['Day_'],  # This is the day position (1st, 2nd, etc.)
-                w['CareType'],
-                w['StayType'],
-                w['Speciality']
-            )
-            weight_lookup[key] = float(w['Weight'] or 0)
+            in_quarter = day_quarters == q
+            slot_codes = day_months[in_quarter] * 10 + day_positions[in_quarter]
+            slot_dates = {
+                (code // 10, code % 10): np.flatnonzero(slot_codes == code)
+                for code in np.unique(slot_codes).tolist()
+            }
+            cal_factors = day_factors[in_quarter]
+            total_cal_factor = cal_factors.sum()
+            if total_cal_factor > 0:
+                even_weights = cal_factors / total_cal_factor
+            else:
+                even_weights = np.full(len(cal_factors), 1.0 / len(cal_factors))
+            dates_by_quarter[q] = {
+                'dates': day_strs[in_quarter].tolist(),
+                'slot_dates': slot_dates,
+                'calendar_factors': cal_factors,
+                'even_weights': even_weights
+            }
         
         # Step 6: Calculate daily distribution for each budget row
         daily_results = []
-        
-        for budget_row in budget_data:
-            branch = budget_row['BranchId']
-            budget_quarter = budget_row['Quarter']  # Get quarter from budget row
-            care_type = budget_row['CareType']
-            stay_type = budget_row['StayType']
-            budget_speciality = budget_row['Speciality']  # NULL for LTC, has value for others
-            budget_census = float(budget_row['Census'] or 0)
-            budget_episodes = float(budget_row['Episodes'] or 0)
-            budget_cpe = float(budget_row['CPE_Budget'] or 0)
-            budget_alos = float(budget_row['ALOS'] or 0)
-            budget_revenue = float(budget_row['Revenue'] or 0)
+        extend_results = daily_results.extend
+        
+        for budget_row in budget_df.itertuples(index=False):
+            branch = budget_row.BranchId
+            budget_quarter = budget_row.Quarter  # Get quarter from budget row
+            care_type = budget_row.CareType
+            stay_type = budget_row.StayType
+            budget_speciality = budget_row.Speciality  # NULL for LTC, has value for others
+            budget_census = budget_row.Census
+            budget_episodes = budget_row.Episodes
+            budget_cpe = budget_row.CPE_Budget
+            budget_alos = budget_row.ALOS
+            budget_revenue = budget_row.Revenue
+            # Stay-type tests are fixed for the whole row
+            is_ltc = stay_type == 'LTC'
+            is_op_er = stay_type in CENSUS_STAY_TYPES
             
             # Get the dates for this budget row's quarter
-            quarter_dates = dates_by_quarter.get(budget_quarter, [])
-            if not quarter_dates:
+            quarter_dates = dates_by_quarter.get(budget_quarter)
+            if quarter_dates is None:
                 continue
             
-            # Calculate month range for this quarter
-            quarter_start_month = (budget_quarter - 1) * 3 + 1
-            quarter_end_month = budget_quarter * 3
-            
             # Get all weights for this branch/caretype/staytype/quarter
             # For non-LTC, also match by Speciality from budget row
             # Store both Revenue weight and Census weight
             relevant_weights = {}
-            relevant_census_weights = {}
-            for w in weights_data:
-                if (w['BranchId'] == branch and 
-                    w['CareType'] == care_type and 
-                    w['StayType'] == stay_type and
-                    w['Quarter'] == budget_quarter):
-                    # For LTC (no speciality in budget), include all weights
-                    # For others, match by speciality
-                    if stay_type == 'LTC' or w['Speciality'] == budget_speciality:
-                        key = (w['Month_'], w['Day_'], w['Speciality'])
-                        relevant_weights[key] = float(w['Weight'] or 0)
-                        relevant_census_weights[key] = float(w['Census_Weight'] or 0)
+            for w in weights_by_group.get((branch, care_type, stay_type, budget_quarter), ()):
+                # For LTC (no speciality in budget), include all weights
+                # For others, match by speciality
+                if is_ltc or w['Speciality'] == budget_speciality:
+                    key = (w['Month_'], w['Day_'], w['Speciality'])
+                    relevant_weights[key] = (float(w['Weight'] or 0), float(w['Census_Weight'] or 0))
             
-            if not relevant_weights:
-                # No weight data - distribute evenly with calendar factors
-                total_cal_factor = sum(d['calendar_factor'] for d in quarter_dates)
-                
-                for date_info in quarter_dates:
-                    d = date_info['date']
-                    cal_factor = date_info['calendar_factor']
-                    weight = cal_factor / total_cal_factor if total_cal_factor > 0 else 1.0 / len(quarter_dates)
-                    
-                    daily_results.append({
-                        'branch_id': branch,
-                        'table_date': str(d),
-                        'quarter': budget_quarter,
-                        'scenario': scenario,
-                        'care_type': care_type,
-                        'stay_type': stay_type,
-                        'speciality': budget_speciality,
-                        'census': round(budget_census * weight, 4) if stay_type in ['OP', 'ER'] else 0,
-                        'episodes': round(budget_episodes * weight, 4) if stay_type in ['OP', 'ER'] else 0,
-                        'cpe': budget_cpe,
-                        'alos': budget_alos,
-                        'revenue': round(budget_revenue * weight, 4)
-                    })
-            else:
-                # Step 6a: Map dates to weights and apply calendar factors
-                # First, collect weights for dates that have weight data
-                # Track both revenue weights and census weights separately
-                date_weights = []
-                dates_with_weights = set()
-                
-                for date_info in quarter_dates:
-                    d = date_info['date']
-                    month = date_info['month']
-                    day_pos = date_info['day_position']
-                    cal_factor = date_info['calendar_factor']
-                    
-                    # Find all speciality combinations for this month/day_position
-                    found_weight = False
-                    for (m, dp, speciality), base_weight in relevant_weights.items():
-                        if m == month and dp == day_pos:
-                            found_weight = True
-                            # Get census weight for this same key
-                            base_census_weight = relevant_census_weights.get((m, dp, speciality), 0)
-                            # Apply calendar factor to both weights
-                            adjusted_weight = base_weight * cal_factor
-                            adjusted_census_weight = base_census_weight * cal_factor
-                            date_weights.append({
-                                'date': d,
-                                'speciality': speciality,
-                                'base_weight': base_weight,
-                                'adjusted_weight': adjusted_weight,
-                                'base_census_weight': base_census_weight,
-                                'adjusted_census_weight': adjusted_census_weight
-                            })
-                    
-                    if found_weight:
-                        dates_with_weights.add(str(d))
-                
-                # Step 6b: Normalize weights so they sum to 1 (preserves budget totals)
-                # This ensures 100% of the budget is distributed to days with weight data
-                # Normalize revenue weights and census weights separately
-                total_adjusted_weight = sum(dw['adjusted_weight'] for dw in date_weights)
-                total_adjusted_census_weight = sum(dw['adjusted_census_weight'] for dw in date_weights)
-                
-                if total_adjusted_weight > 0:
-                    for dw in date_weights:
-                        # Use revenue weight for revenue distribution
-                        normalized_weight = dw['adjusted_weight'] / total_adjusted_weight
-                        # Use census weight for episodes distribution (based on Census from vw_actual_for_weight)
-                        normalized_census_weight = dw['adjusted_census_weight'] / total_adjusted_census_weight if total_adjusted_census_weight > 0 else normalized_weight
-                        
-                        daily_results.append({
-                            'branch_id': branch,
-                            'table_date': str(dw['date']),
-                            'quarter': budget_quarter,
-                            'scenario': scenario,
-                            'care_type': care_type,
-                            'stay_type': stay_type,
-                            'speciality': budget_speciality if stay_type != 'LTC' else dw['speciality'],
-                            'census': round(budget_census * normalized_census_weight, 4) if stay_type in ['OP', 'ER'] else 0,
-                            'episodes': round(budget_episodes * normalized_census_weight, 4) if stay_type in ['OP', 'ER'] else 0,
-                            'cpe': budget_cpe,
-                            'alos': budget_alos,
-                            'revenue': round(budget_revenue * normalized_weight, 4)
-                        })
+            # Step 6a: Join weights to dates on (month, day position) and apply
+            # calendar factors to both revenue and census weights.
+            # Each weight entry expands to its slot's dates; a stable sort by date
+            # restores date order, keeping weight order within a date
+            total_adjusted_weight = 0
+            if relevant_weights:
+                slot_dates = quarter_dates['slot_dates']
+                entry_dates = [slot_dates.get(key[:2], no_dates) for key in relevant_weights]
+                entry_counts = [len(dates) for dates in entry_dates]
+                date_idx = np.concatenate(entry_dates)
+                if len(date_idx):
+                    order = np.argsort(date_idx, kind='stable')
+                    date_idx = date_idx[order]
+                    weight_pairs = np.repeat(np.array(list(relevant_weights.values())), entry_counts, axis=0)[order]
+                    cal_factors = quarter_dates['calendar_factors'][date_idx]
+                    adjusted_weights = weight_pairs[:, 0] * cal_factors
+                    adjusted_census_weights = weight_pairs[:, 1] * cal_factors
+                    total_adjusted_weight = adjusted_weights.sum()
+            
+            # Step 6b: Normalize weights so they sum to 1 (preserves budget totals)
+            # This ensures 100% of the budget is distributed to days with weight data
+            # Normalize revenue weights and census weights separately
+            if total_adjusted_weight > 0:
+                # Revenue weight for revenue; census weight (based on Census from
+                # vw_actual_for_weight) for census and episodes
+                normalized_weights = adjusted_weights / total_adjusted_weight
+                total_adjusted_census_weight = adjusted_census_weights.sum()
+                if total_adjusted_census_weight > 0:
+                    normalized_census_weights = adjusted_census_weights / total_adjusted_census_weight
                 else:
-                    # Fallback: If no weights matched, distribute evenly across all days
-                    total_cal_factor = sum(d['calendar_factor'] for d in quarter_dates)
-                    for date_info in quarter_dates:
-                        d = date_info['date']
-                        cal_factor = date_info['calendar_factor']
-                        weight = cal_factor / total_cal_factor if total_cal_factor > 0 else 1.0 / len(quarter_dates)
-                        
-                        daily_results.append({
-                            'branch_id': branch,
-                            'table_date': str(d),
-                            'quarter': budget_quarter,
-                            'scenario': scenario,
-                            'care_type': care_type,
-                            'stay_type': stay_type,
-                            'speciality': budget_speciality,
-                            'census': round(budget_census * weight, 4) if stay_type in ['OP', 'ER'] else 0,
-                            'episodes': round(budget_episodes * weight, 4) if stay_type in ['OP', 'ER'] else 0,
-                            'cpe': budget_cpe,
-                            'alos': budget_alos,
-                            'revenue': round(budget_revenue * weight, 4)
-                        })
-        
-        # Aggregate results for display (Branch, Day, CareType, StayType, Speciality)
-        aggregated = defaultdict(lambda: {'census': 0, 'episodes': 0, 'revenue': 0, 'cpe': 0, 'alos': 0})
-        for r in daily_results:
-            key = (r['branch_id'], r['table_date'], r['care_type'], r['stay_type'], r['speciality'], r['scenario'])
-            aggregated[key]['census'] += r['census']
-            aggregated[key]['episodes'] += r['episodes']
-            aggregated[key]['revenue'] += r['revenue']
-            aggregated[key]['cpe'] = r['cpe']
-            aggregated[key]['alos'] = r['alos']
-        
-        aggregated_results = []
-        for (branch_id, table_date, care_type, stay_type, speciality, scen), values in aggregated.items():
-            # Derive quarter from date
-            month = int(table_date.split('-')[1])
-            quarter = (month - 1) // 3 + 1
-            aggregated_results.append({
-                'branch_id': branch_id,
+                    normalized_census_weights = normalized_weights
+                quarter_date_strs = quarter_dates['dates']
+                row_dates = [quarter_date_strs[i] for i in date_idx.tolist()]
+                row_specialities = None
+                if is_ltc:
+                    entry_specialities = np.array([key[2] for key in relevant_weights], dtype=object)
+                    row_specialities = np.repeat(entry_specialities, entry_counts)[order].tolist()
+            else:
+                # No weight data (or all weights zero) - distribute evenly with calendar factors
+                normalized_weights = normalized_census_weights = quarter_dates['even_weights']
+                row_dates = quarter_dates['dates']
+                row_specialities = None
+            
+            # Distribute whole quarters at once; census and episodes only apply
+            # to OP/ER. Values stay unrounded here and are rounded once, after
+            # aggregation, so the distributed totals match the source
+            revenues = (budget_revenue * normalized_weights).tolist()
+            if is_op_er:
+                censuses = (budget_census * normalized_census_weights).tolist()
+                episodes = (budget_episodes * normalized_census_weights).tolist()
+            else:
+                censuses = episodes = repeat(0)
+            
+            extend_results({
+                'branch_id': branch,
                 'table_date': table_date,
-                'quarter': quarter,
-                'scenario': scen,
+                'quarter': budget_quarter,
+                'scenario': scenario,
                 'care_type': care_type,
                 'stay_type': stay_type,
                 'speciality': speciality,
-                'census': round(values['census'], 4),
-                'episodes': round(values['episodes'], 4),
-                'cpe': values['cpe'],
-                'alos': values['alos'],
-                'revenue': round(values['revenue'], 4)
-            })
-        
-        # Sort by date
-        aggregated_results.sort(key=lambda x: (x['table_date'], x['branch_id'], x['care_type'], x['speciality'] or ''))
-        
-        # Calculate distributed totals for verification
-        distributed_total_revenue = sum(r['revenue'] for r in aggregated_results)
-        distributed_total_census = sum(r['census'] for r in aggregated_results)
+                'census': census,
+                'episodes': episode_count,
+                'cpe': budget_cpe,
+                'alos': budget_alos,
+                'revenue': revenue
+            } for table_date, speciality, census, episode_count, revenue in zip(
+                row_dates, row_specialities or repeat(budget_speciality), censuses, episodes, revenues))
         
-        return jsonify({
+        # Aggregate results for display (Branch, Day, CareType, StayType, Speciality)
+        # with one groupby; sort=False keeps groups in first-seen order
+        aggregated_results = []
+        distributed_total_revenue = distributed_total_census = 0.0
+        if daily_results:
+            import pandas as pd
+            
+            detail_df = pd.DataFrame(daily_results, dtype=object)
+            for column in ('census', 'episodes', 'revenue'):
+                detail_df[column] = detail_df[column].astype(float)
+            
+            agg_df = detail_df.groupby(
+                ['branch_id', 'table_date', 'care_type', 'stay_type', 'speciality', 'scenario'],
+                dropna=False, sort=False
+            ).agg(
+                census=('census', 'sum'),
+                episodes=('episodes', 'sum'),
+                revenue=('revenue', 'sum'),
+                cpe=('cpe', 'last'),
+                alos=('alos', 'last')
+            ).reset_index()
+            
+            # Group keys come back with NULL as NaN; restore None for the JSON output
+            for column in ('care_type', 'stay_type', 'speciality'):
+                agg_df[column] = agg_df[column].astype(object).where(agg_df[column].notna(), None)
+            
+            # Derive quarter from date
+            agg_df['quarter'] = (agg_df['table_date'].str[5:7].astype(int) - 1) // 3 + 1
+            agg_df = agg_df.round({'census': 4, 'episodes': 4, 'revenue': 4})
+            
+            # Calculate distributed totals for verification
+            distributed_total_revenue = float(agg_df['revenue'].sum())
+            distributed_total_census = float(agg_df['census'].sum())
+            
+            # Sort by date (stable, so ties keep first-seen order); no speciality sorts first
+            agg_df['speciality_key'] = agg_df['speciality'].fillna('')
+            agg_df = agg_df.sort_values(['table_date', 'branch_id', 'care_type', 'speciality_key'], kind='stable')
+            aggregated_results = agg_df[[
+                'branch_id', 'table_date', 'quarter', 'scenario', 'care_type', 'stay_type',
+                'speciality', 'census', 'episodes', 'cpe', 'alos', 'revenue'
+            ]].to_dict('records')
+        
+        result = {
             'success': True,
             'year': year,
             'quarter': quarter,  # None if full year
@@ -2257,7 +2425,6 @@ def calculate_daily_budget():
             'total_records': len(aggregated_results),
             'detail_records': len(daily_results),
             'daily_budget': aggregated_results,
-            'detail_data': daily_results,  # Full detail at purchaser/speciality level
             # Totals for verification
             'source_totals': {
                 'revenue': round(source_total_revenue, 2),
@@ -2267,11 +2434,19 @@ def calculate_daily_budget():
                 'revenue': round(distributed_total_revenue, 2),
                 'census': round(distributed_total_census, 2)
             }
-        })
+        }
+        # Full detail at purchaser/speciality level roughly doubles the payload,
+        # so only send it when asked for
+        if request.args.get('include_detail') == '1':
+            result['detail_data'] = daily_results
+        # Admins can publish this calculation by key instead of uploading the rows
+        if session.get('role') == 'admin':
+            result['cache_key'] = cache_publish_rows(
+                session.get('username'), (year, tuple(quarters_to_process), scenario), aggregated_results)
+        return ojsonify(result)
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Daily budget calculation failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -2306,10 +2481,10 @@ def get_daily_budget_summary():
             query_params['branch_id'] = branch_id
         
         budget_result = ch_client.query(budget_query, parameters=query_params)
-        budget_columns = budget_result.column_names
-        budget_data = [dict(zip(budget_columns, row)) for row in budget_result.result_rows]
+        budget_data = list(budget_result.named_results())
         
-        return jsonify({
+        # Decimal measures are sent as strings, as jsonify did
+        return ojsonify({
             'success': True,
             'quarterly_budget': budget_data,
             'year': year,
@@ -2321,6 +2496,58 @@ def get_daily_budget_summary():
         return jsonify({'error': str(e)}), 500
 
 
+CREATE_BUDGET_DATA_SQL = """
+    CREATE TABLE IF NOT EXISTS budget.budget_data (
+        BranchId UInt8,
+        TableDate Date32,
+        Year UInt16,
+        Quarter UInt8,
+        Scenario String,
+        CareType String,
+        StayType String,
+        Speciality String,
+        Census Float64,
+        Episodes Float64,
+        CPE Float64,
+        ALOS Float64,
+        Revenue Float64,
+        is_last_value UInt8 DEFAULT 1,
+        CreatedAt DateTime DEFAULT now(),
+        CreatedBy String,
+        INDEX idx_is_last_value is_last_value TYPE minmax GRANULARITY 1
+    ) ENGINE = MergeTree()
+    ORDER BY (Year, Quarter, Scenario, BranchId, TableDate, CareType, StayType, Speciality, CreatedAt)
+"""
+
+_budget_data_ready = False
+_budget_data_lock = threading.Lock()
+
+
+def ensure_budget_data_table(ch_client):
+    """Create budget.budget_data on the first publish in this process.
+    Tables created before the is_last_value skip index existed get it added and
+    built for their existing parts (MATERIALIZE INDEX runs as a background
+    mutation), so summary reads over historical data can skip retired rows."""
+    global _budget_data_ready
+    if _budget_data_ready:
+        return
+    with _budget_data_lock:
+        if _budget_data_ready:
+            return
+        ch_client.command(CREATE_BUDGET_DATA_SQL)
+        has_index = ch_client.command("""
+            SELECT count() FROM system.data_skipping_indices
+            WHERE database = 'budget' AND table = 'budget_data' AND name = 'idx_is_last_value'
+        """)
+        if not has_index:
+            ch_client.command("""
+                ALTER TABLE budget.budget_data
+                ADD INDEX IF NOT EXISTS idx_is_last_value is_last_value TYPE minmax GRANULARITY 1
+            """)
+            ch_client.command("ALTER TABLE budget.budget_data MATERIALIZE INDEX idx_is_last_value")
+        _budget_data_ready = True
+
+
 @app.route('/api/daily-budget/publish', methods=['POST'])
 @admin_required
 def publish_to_clickhouse():
@@ -2328,151 +2555,133 @@ def publish_to_clickhouse():
     Publish daily budget data to ClickHouse budget_data table.
     Inserts the calculated daily budget at speciality level.
     Supports both single quarter and full year (multiple quarters) publishing.
+    The rows come either as detail_data or, for a calculation this admin just
+    ran, as the cache_key returned by /api/daily-budget/calculate. An unknown
+    or expired key gets a 409 so the page can resend the rows.
     """
     try:
-        data = request.json
+        data = json_body()
         detail_data = data.get('detail_data', [])
+        cache_key = data.get('cache_key')
         year = data.get('year')
         quarters = data.get('quarters', [])  # List of quarters being published
         scenario = data.get('scenario')
         
-        print(f"Publish request: year={year}, quarters={quarters}, scenario={scenario}, detail_data_count={len(detail_data)}")
+        logger.info("Publish request: year=%s, quarters=%s, scenario=%s, detail_data_count=%d, cache_key=%s",
+                    year, quarters, scenario, len(detail_data), bool(cache_key))
         
-        if not detail_data:
+        if not detail_data and not cache_key:
             return jsonify({'error': 'No data to publish'}), 400
         
         if not quarters:
             return jsonify({'error': 'Quarters list is required'}), 400
         
+        try:
+            quarters = [int(q) for q in quarters]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Quarters must be numbers'}), 400
+        
+        if not detail_data:
+            detail_data = pop_publish_rows(session.get('username'), cache_key, (year, tuple(quarters), scenario))
+            if detail_data is None:
+                return jsonify({'error': 'Calculation is no longer cached, please resend the data', 'cache_miss': True}), 409
+            if not detail_data:
+                return jsonify({'error': 'No data to publish'}), 400
+        
         ch_client = get_clickhouse_connection()
         
-        # Create budget_data table if not exists
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS budget.budget_data (
-            BranchId UInt8,
-            TableDate Date32,
-            Year UInt16,
-            Quarter UInt8,
-            Scenario String,
-            CareType String,
-            StayType String,
-            Speciality String,
-            Census Float64,
-            Episodes Float64,
-            CPE Float64,
-            ALOS Float64,
-            Revenue Float64,
-            is_last_value UInt8 DEFAULT 1,
-            CreatedAt DateTime DEFAULT now(),
-            CreatedBy String
-        ) ENGINE = MergeTree()
-        ORDER BY (Year, Quarter, Scenario, BranchId, TableDate, CareType, StayType, Speciality, CreatedAt)
-        """
-        ch_client.command(create_table_query)
+        # Create budget_data and its skip index (once per process)
+        ensure_budget_data_table(ch_client)
         
         # Mark existing data as not latest (is_last_value = 0) instead of deleting
         # This preserves history and allows rollback to previous versions
         # Use mutations_sync = 1 to ensure UPDATE completes before INSERT
-        for q in quarters:
-            update_query = """
-            ALTER TABLE budget.budget_data UPDATE is_last_value = 0 
-            WHERE Year = {year:UInt32} AND Quarter = {quarter:UInt8} AND Scenario = {scenario:String} AND is_last_value = 1
-            SETTINGS mutations_sync = 1
-            """
-            ch_client.command(update_query, parameters={'year': year, 'quarter': q, 'scenario': scenario})
+        # One mutation covers every published quarter so the parts are rewritten once
+        update_query = """
+        ALTER TABLE budget.budget_data UPDATE is_last_value = 0 
+        WHERE Year = {year:UInt32} AND Quarter IN {quarters:Array(UInt8)} AND Scenario = {scenario:String} AND is_last_value = 1
+        SETTINGS mutations_sync = 1
+        """
+        ch_client.command(update_query, parameters={'year': year, 'quarters': quarters, 'scenario': scenario})
         
         # Prepare data for insertion
         created_by = session.get('username', 'system')
-        from datetime import date as dt_date
-        
-        rows = []
-        skipped_records = 0
-        for record in detail_data:
-            # Convert string date to date object for ClickHouse Date32
-            table_date = record['table_date']
-            if isinstance(table_date, str):
-                table_date = dt_date.fromisoformat(table_date)
-            
-            # Get quarter from record, or derive from date if missing
-            record_quarter = record.get('quarter')
-            if record_quarter is None:
-                # Derive quarter from date
-                month = table_date.month if hasattr(table_date, 'month') else int(record['table_date'].split('-')[1])
-                record_quarter = (month - 1) // 3 + 1
-            
-            # Ensure non-nullable string columns are not None (replace with empty string)
-            care_type = record.get('care_type') or ''
-            stay_type = record.get('stay_type') or ''
-            speciality = record.get('speciality') or ''  # Replace None with empty string
-            
-            # Skip records with missing required fields
-            if not care_type or not stay_type:
-                skipped_records += 1
-                continue
-            
-            rows.append([
-                record['branch_id'],
-                table_date,
-                year,
-                record_quarter,
-                scenario,
-                care_type,
-                stay_type,
-                speciality,
-                float(record.get('census', 0) or 0),
-                float(record.get('episodes', 0) or 0),
-                float(record.get('cpe', 0) or 0),
-                float(record.get('alos', 0) or 0),
-                float(record.get('revenue', 0) or 0),
-                1,  # is_last_value = 1 for new records
-                created_by
-            ])
+        
+        # Skip records with missing required fields (non-nullable string columns)
+        records = [r for r in detail_data if r.get('care_type') and r.get('stay_type')]
+        skipped_records = len(detail_data) - len(records)
+        record_count = len(records)
         
         if skipped_records > 0:
-            print(f"Skipped {skipped_records} records with missing required fields")
+            logger.warning("Skipped %d records with missing required fields", skipped_records)
+        
+        # Build the insert column by column so the driver can encode each column
+        # as one block instead of transposing per-record row lists.
+        # Convert string dates to date objects for ClickHouse Date32, parsing each
+        # distinct date (at most a year's worth) once
+        date_values = [r['table_date'] for r in records]
+        parsed_dates = {d: date.fromisoformat(d) for d in set(date_values) if isinstance(d, str)}
+        table_dates = [parsed_dates.get(d, d) for d in date_values] if parsed_dates else date_values
+        
+        # Get quarter from record, or derive from date if missing
+        record_quarters = [
+            r.get('quarter') if r.get('quarter') is not None else (d.month - 1) // 3 + 1
+            for r, d in zip(records, table_dates)
+        ]
         
-        print(f"Publishing {len(rows)} records to ClickHouse...")
+        publish_columns = ['BranchId', 'TableDate', 'Year', 'Quarter', 'Scenario',
+                           'CareType', 'StayType', 'Speciality',
+                           'Census', 'Episodes', 'CPE', 'ALOS', 'Revenue', 'is_last_value', 'CreatedBy']
+        column_data = [
+            [r['branch_id'] for r in records],
+            table_dates,
+            [year] * record_count,
+            record_quarters,
+            [scenario] * record_count,
+            [r['care_type'] for r in records],
+            [r['stay_type'] for r in records],
+            [r.get('speciality') or '' for r in records],  # Replace None with empty string
+            [float(r.get('census', 0) or 0) for r in records],
+            [float(r.get('episodes', 0) or 0) for r in records],
+            [float(r.get('cpe', 0) or 0) for r in records],
+            [float(r.get('alos', 0) or 0) for r in records],
+            [float(r.get('revenue', 0) or 0) for r in records],
+            [1] * record_count,  # is_last_value = 1 for new records
+            [created_by] * record_count
+        ]
+        
+        logger.info("Publishing %d records to ClickHouse...", record_count)
         
         # Insert data in batches to handle large datasets and identify problematic records
         batch_size = 10000
         total_inserted = 0
         failed_batches = []
         
-        for i in range(0, len(rows), batch_size):
-            batch = rows[i:i + batch_size]
+        for i in range(0, record_count, batch_size):
+            batch = [column[i:i + batch_size] for column in column_data]
+            batch_len = len(batch[0])
             batch_num = i // batch_size + 1
             try:
-                ch_client.insert(
-                    'budget.budget_data',
-                    batch,
-                    column_names=['BranchId', 'TableDate', 'Year', 'Quarter', 'Scenario', 
-                                 'CareType', 'StayType', 'Speciality',
-                                 'Census', 'Episodes', 'CPE', 'ALOS', 'Revenue', 'is_last_value', 'CreatedBy']
-                )
-                total_inserted += len(batch)
-                print(f"Batch {batch_num}: Inserted {len(batch)} records (total: {total_inserted})")
+                ch_client.insert('budget.budget_data', batch, column_names=publish_columns, column_oriented=True)
+                total_inserted += batch_len
+                logger.debug("Batch %d: Inserted %d records (total: %d)", batch_num, batch_len, total_inserted)
             except Exception as batch_err:
-                print(f"Batch {batch_num} failed: {str(batch_err)}")
-                failed_batches.append({'batch': batch_num, 'start': i, 'end': i + len(batch), 'error': str(batch_err)})
+                logger.warning("Batch %d failed: %s", batch_num, batch_err)
+                failed_batches.append({'batch': batch_num, 'start': i, 'end': i + batch_len, 'error': str(batch_err)})
                 
                 # Try to insert records one by one to identify problematic ones
-                for j, row in enumerate(batch):
+                for j in range(batch_len):
+                    row = [column[j] for column in batch]
                     try:
-                        ch_client.insert(
-                            'budget.budget_data',
-                            [row],
-                            column_names=['BranchId', 'TableDate', 'Year', 'Quarter', 'Scenario', 
-                                         'CareType', 'StayType', 'Speciality',
-                                         'Census', 'Episodes', 'CPE', 'ALOS', 'Revenue', 'is_last_value', 'CreatedBy']
-                        )
+                        ch_client.insert('budget.budget_data', [row], column_names=publish_columns)
                         total_inserted += 1
                     except Exception as row_err:
-                        print(f"  Row {i + j} failed: {row[:8]}... Error: {str(row_err)[:100]}")
+                        logger.warning("  Row %d failed: %s... Error: %.100s", i + j, row[:8], row_err)
         
         if failed_batches:
-            print(f"Warning: {len(failed_batches)} batches had issues")
+            logger.warning("%d batches had issues", len(failed_batches))
         
-        print(f"Total inserted: {total_inserted} out of {len(rows)} records")
+        logger.info("Total inserted: %d out of %d records", total_inserted, record_count)
         
         # Verify actual count after insert
         verify_query = """
@@ -2485,19 +2694,18 @@ def publish_to_clickhouse():
         verify_result = ch_client.query(verify_query, parameters={'year': year, 'scenario': scenario})
         actual_count = verify_result.result_rows[0][0] if verify_result.result_rows else 0
         
-        print(f"Verified: {actual_count} records with is_last_value=1")
+        logger.info("Verified: %s records with is_last_value=1", actual_count)
         
         return jsonify({
             'success': True,
-            'message': f'Successfully published {len(rows)} records to ClickHouse ({actual_count} verified)',
-            'records_count': len(rows),
+            'message': f'Successfully published {record_count} records to ClickHouse ({actual_count} verified)',
+            'records_count': record_count,
             'actual_count': actual_count,
             'quarters': quarters
         })
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Daily budget publish failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -2583,13 +2791,13 @@ def get_published_budget_summary():
             })
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Published budget summary query failed")
         return jsonify({'error': str(e)}), 500
 
 
 if __name__ == '__main__':
-    # Suppress Werkzeug request logs
+    # Show the app's info logs on the console; suppress Werkzeug request logs
+    logging.basicConfig(level=logging.INFO)
     log = logging.getLogger('werkzeug')
     log.setLevel(logging.WARNING)
     
@@ -1,6 +1,7 @@
 """
 Gunicorn configuration for production
 """
+import os
 import multiprocessing
 
 # Server socket
@@ -8,9 +9,16 @@ bind = "0.0.0.0:8000"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-worker_connections = 1000
+# gevent workers multiplex concurrent requests inside each process, so requests
+# waiting on PostgreSQL/ClickHouse no longer block the worker. psycopg detects
+# gevent's monkey-patching and waits cooperatively (psycogreen is not needed).
+# One worker per core is enough since each serves many requests at once.
+# WEB_CONCURRENCY is exported so the app can split the PostgreSQL connection
+# limit between the workers (see PG_POOL_MAX_SIZE in app.py).
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = "gevent"
+worker_connections = 100
 timeout = 120
 keepalive = 5
 
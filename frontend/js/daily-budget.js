@@ -6,7 +6,7 @@
 const API_BASE = '';
 let currentUser = null;
 let dailyBudgetData = [];
-let detailData = [];  // Full detail at purchaser/speciality level for publishing
+let detailRecordCount = 0;  // Number of purchaser/speciality-level detail rows
 let calculationParams = {};  // Store year, quarter, scenario for publish
 let sourceTotals = null;  // Store source totals from API
 let currentPage = 1;
@@ -216,7 +216,7 @@ async function loadScenarios() {
 function saveCalculationData() {
     const dataToSave = {
         dailyBudgetData,
-        detailData,
+        detailRecordCount,
         calculationParams,
         sourceTotals,
         timestamp: Date.now(),
@@ -256,7 +256,8 @@ function restoreCalculationData() {
         
         // Restore data
         dailyBudgetData = data.dailyBudgetData || [];
-        detailData = data.detailData || [];
+        // Older saved calculations stored the full detail rows
+        detailRecordCount = data.detailRecordCount ?? (data.detailData || []).length;
         calculationParams = data.calculationParams || {};
         sourceTotals = data.sourceTotals || null;
         
@@ -339,8 +340,8 @@ async function calculateDailyBudget() {
         }
 
         dailyBudgetData = data.daily_budget;  // Aggregated data for display
-        detailData = data.detail_data || [];   // Detail data for publishing
-        calculationParams = { year: parseInt(year), quarters: data.quarters || [quarter], scenario };
+        detailRecordCount = data.detail_records || 0;
+        calculationParams = { year: parseInt(year), quarters: data.quarters || [quarter], scenario, cacheKey: data.cache_key || null };
         currentPage = 1;
         
         // Store source totals from API response
@@ -790,7 +791,7 @@ function goToPage(page) {
  * Publish to ClickHouse (budget_data table)
  */
 async function exportToClickHouse() {
-    if (!detailData.length) {
+    if (!detailRecordCount) {
         showStatus('No data to publish', 'error');
         return;
     }
@@ -825,7 +826,7 @@ function showPublishModal() {
     document.getElementById('modal-year').textContent = calculationParams.year;
     document.getElementById('modal-period').textContent = quartersText;
     document.getElementById('modal-scenario').textContent = scenarioDisplay;
-    document.getElementById('modal-records').textContent = detailData.length.toLocaleString();
+    document.getElementById('modal-records').textContent = detailRecordCount.toLocaleString();
     document.getElementById('modal-revenue').textContent = formatCurrency(totalRevenue);
     document.getElementById('modal-census').textContent = formatNumber(Math.round(totalCensus));
     document.getElementById('modal-episodes').textContent = formatNumber(Math.round(totalEpisodes));
@@ -889,19 +890,28 @@ async function confirmPublish() {
     hidePublishModal();
     showLoading(true);
 
+    const publish = (rows) => fetch(`${API_BASE}/api/daily-budget/publish`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'include',
+        body: JSON.stringify({ 
+            ...rows,
+            year: calculationParams.year,
+            quarters: calculationParams.quarters,
+            scenario: calculationParams.scenario
+        })
+    });
+
     try {
-        // Use dailyBudgetData (aggregated) instead of detailData (raw) to avoid duplicates
-        const response = await fetch(`${API_BASE}/api/daily-budget/publish`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            credentials: 'include',
-            body: JSON.stringify({ 
-                detail_data: dailyBudgetData,
-                year: calculationParams.year,
-                quarters: calculationParams.quarters,
-                scenario: calculationParams.scenario
-            })
-        });
+        // Publish the rows the server kept from the calculation; if they are gone
+        // (expired, or another worker), upload dailyBudgetData (aggregated) instead
+        // of the raw detail to avoid duplicates
+        let response = calculationParams.cacheKey
+            ? await publish({ cache_key: calculationParams.cacheKey })
+            : null;
+        if (!response || response.status === 409) {
+            response = await publish({ detail_data: dailyBudgetData });
+        }
 
         const data = await response.json();
 